@@ -1,24 +1,33 @@
 from datetime import datetime
 from typing import List
 
-from passlib.context import CryptContext
 from sqlalchemy import insert, select, update, delete
-from fastapi import Depends, HTTPException, APIRouter
+from fastapi import Depends, HTTPException, APIRouter, Response
 from sqlalchemy.exc import NoResultFound
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
-from accounts.scheme import RegisterScheme, LoginScheme, UserInfoScheme, CostumerAddScheme
-from accounts.utils import generate_token, verify_token
+from accounts.scheme import RegisterScheme, LoginScheme, UserInfoScheme, CostumerAddScheme, RefreshTokenScheme, \
+    LogoutScheme
+from accounts.utils import generate_token, verify_token, verify_refresh_token, hash_password, verify_password, \
+    revoke_token
+from config import TOKEN_ROLE_CLAIMS
 from database import get_async_session
 from models.models import User, Costumer, Warehouse, Shift, UserRoles
-from permissions import permission
+from pagination import PageParams, paginate
+from permissions import permission, get_user_roles
 from warehouse.scheme import WarehouseGetScheme
 
-pwd_context = CryptContext(schemes=['bcrypt'], deprecated='auto')
 account_router = APIRouter()
 
 
+async def issue_token(user_id: int, warehouse_id: int, session: AsyncSession, use_cache: bool = True):
+    if TOKEN_ROLE_CLAIMS:
+        roles = await get_user_roles(user_id, session, use_cache=use_cache)
+        return generate_token(user_id, roles, warehouse_id)
+    return generate_token(user_id)
+
+
 @account_router.post("/register")
 async def register(
         user: RegisterScheme,
@@ -43,7 +52,7 @@ async def register(
                     login=user.login,
                     email=user.email,
                     phone=user.phone_number,
-                    password=pwd_context.hash(user.password1),
+                    password=await hash_password(user.password1),
                     shift_id=user.shift_id,
                     warehouse_id=user.warehouse_id
                 )
@@ -64,15 +73,40 @@ async def login(
     query = select(User).where((User.login == user.login))
     user_login = await session.execute(query)
     user_obj = user_login.scalars().one()
-    if pwd_context.verify(user.password, user_obj.password):
+    if await verify_password(user.password, user_obj.password):
         user_id = user_obj.id
+        warehouse_id = user_obj.warehouse_id
         user_obj.last_updated = datetime.now()
         await session.commit()
-        return generate_token(user_id)
+        return await issue_token(user_id, warehouse_id, session)
     else:
         raise HTTPException(status_code=400, detail="Login failed")
 
 
+@account_router.post('/refresh')
+async def refresh(
+        data: RefreshTokenScheme,
+        session: AsyncSession = Depends(get_async_session)
+):
+    payload = verify_refresh_token(data.refresh_token)
+    user = await session.get(User, payload['user_id'])
+    if user is None:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    revoke_token(payload)
+    return await issue_token(user.id, user.warehouse_id, session, use_cache=False)
+
+
+@account_router.post('/logout')
+async def logout(
+        data: LogoutScheme,
+        token: dict = Depends(verify_token)
+):
+    if data.refresh_token:
+        revoke_token(verify_refresh_token(data.refresh_token))
+    revoke_token(token)
+    return {'success': True, 'message': 'Logged out'}
+
+
 @account_router.get('/user_info', response_model=UserInfoScheme)
 async def user_info(
         token: dict = Depends(verify_token),
@@ -87,14 +121,14 @@ async def user_info(
 
 @account_router.get('/all-users', response_model=List[UserInfoScheme])
 async def all_users(
+        response: Response,
+        page: PageParams = Depends(),
         token: dict = Depends(verify_token),
         session: AsyncSession = Depends(get_async_session)
 ):
-    if await permission(token['user_id'], session, ['admin', 'Boss']):
-        query = select(User)
-        users = await session.execute(query)
-        users_data = users.scalars().all()
-        return users_data
+    if await permission(token['user_id'], session, ['admin', 'Boss'], token.get('roles')):
+        query = select(User).options(selectinload(User.warehouse), selectinload(User.shift))
+        return await paginate(session, query, [User.id], page, response, hidden=('password',))
     else:
         raise HTTPException(status_code=403, detail="Forbidden")
 
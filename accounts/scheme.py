@@ -39,6 +39,14 @@ class LoginScheme(BaseModel):
     password: str = Field(min_length=8)
 
 
+class RefreshTokenScheme(BaseModel):
+    refresh_token: str
+
+
+class LogoutScheme(BaseModel):
+    refresh_token: Union[str, None] = None
+
+
 class CostumerAddScheme(BaseModel):
     firstname: str
     lastname: str
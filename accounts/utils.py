@@ -1,18 +1,76 @@
+import asyncio
+import hashlib
 import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
 import jwt
 import secrets
 from datetime import datetime, timedelta
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi import Depends, HTTPException
 from dotenv import load_dotenv
+from passlib.context import CryptContext
+
+from config import PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_QUEUE, TOKEN_CACHE_SIZE
 
 load_dotenv()
 secret_key = os.environ.get('SECRET')
 algorithm = 'HS256'
 security = HTTPBearer()
 
+pwd_context = CryptContext(schemes=['bcrypt'], deprecated='auto')
+_hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix='password-hash')
+_hash_lock = threading.Lock()
+_hash_stats = {'submitted': 0, 'started': 0, 'completed': 0, 'rejected': 0}
+
+_token_cache = OrderedDict()
+_revoked_jti = {}
+
+
+def _run_tracked(func, *args):
+    with _hash_lock:
+        _hash_stats['started'] += 1
+    try:
+        return func(*args)
+    finally:
+        with _hash_lock:
+            _hash_stats['completed'] += 1
+
+
+async def _run_in_hash_pool(func, *args):
+    with _hash_lock:
+        if _hash_stats['submitted'] - _hash_stats['started'] >= PASSWORD_HASH_MAX_QUEUE:
+            _hash_stats['rejected'] += 1
+            raise HTTPException(status_code=503, detail="Server is busy, try again later")
+        _hash_stats['submitted'] += 1
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_hash_executor, _run_tracked, func, *args)
+
+
+async def hash_password(password: str) -> str:
+    return await _run_in_hash_pool(pwd_context.hash, password)
+
 
-def generate_token(user_id: int):
+async def verify_password(password: str, hashed_password: str) -> bool:
+    return await _run_in_hash_pool(pwd_context.verify, password, hashed_password)
+
+
+def hash_pool_stats():
+    with _hash_lock:
+        return {
+            'workers': PASSWORD_HASH_WORKERS,
+            'max_queue': PASSWORD_HASH_MAX_QUEUE,
+            'queue_depth': _hash_stats['submitted'] - _hash_stats['started'],
+            'running': _hash_stats['started'] - _hash_stats['completed'],
+            'completed': _hash_stats['completed'],
+            'rejected': _hash_stats['rejected'],
+        }
+
+
+def generate_token(user_id: int, roles=None, warehouse_id: int = None):
     jti_access = str(secrets.token_urlsafe(32))
     jti_refresh = str(secrets.token_urlsafe(32))
     data_access_token = {
@@ -21,6 +79,9 @@ def generate_token(user_id: int):
         'user_id': user_id,
         'jti': jti_access
     }
+    if roles is not None:
+        data_access_token['roles'] = sorted(roles)
+        data_access_token['warehouse_id'] = warehouse_id
     data_refresh_token = {
         'token_type': 'refresh',
         'exp': datetime.utcnow() + timedelta(days=1),
@@ -36,20 +97,42 @@ def generate_token(user_id: int):
     }
 
 
-def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    try:
-        token = credentials.credentials
-        secret_key = os.environ.get('SECRET')
-
-        payload = jwt.decode(token, secret_key, algorithms=['HS256'])
-        return payload
-    except jwt.ExpiredSignatureError:
+def decode_token(token: str):
+    key = hashlib.sha256(token.encode()).digest()
+    payload = _token_cache.get(key)
+    if payload is None:
+        try:
+            payload = jwt.decode(token, secret_key, algorithms=['HS256'])
+        except jwt.ExpiredSignatureError:
+            raise HTTPException(status_code=401, detail="Token has expired")
+        except jwt.InvalidTokenError:
+            raise HTTPException(status_code=401, detail="Invalid token")
+        _token_cache[key] = payload
+        if len(_token_cache) > TOKEN_CACHE_SIZE:
+            _token_cache.popitem(last=False)
+    elif payload['exp'] <= time.time():
+        _token_cache.pop(key, None)
         raise HTTPException(status_code=401, detail="Token has expired")
-    except jwt.InvalidTokenError:
-        raise HTTPException(status_code=401, detail="Invalid token")
+    else:
+        _token_cache.move_to_end(key)
+    if payload.get('jti') in _revoked_jti:
+        raise HTTPException(status_code=401, detail="Token has been revoked")
+    return payload
 
 
+def revoke_token(payload: dict):
+    now = time.time()
+    for jti in [jti for jti, exp in _revoked_jti.items() if exp <= now]:
+        del _revoked_jti[jti]
+    _revoked_jti[payload['jti']] = payload['exp']
 
 
+def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    return decode_token(credentials.credentials)
 
 
+def verify_refresh_token(token: str):
+    payload = decode_token(token)
+    if payload.get('token_type') != 'refresh':
+        raise HTTPException(status_code=401, detail="Invalid token")
+    return payload
@@ -0,0 +1,39 @@
+"""Split-fulfilment allocation for a 50-line order across 200 warehouses.
+
+Run from the project root: python -m benchmarks.bench_allocation
+"""
+import random
+import timeit
+
+from market.allocation import allocate, exact_warehouses, greedy_warehouses
+
+LINES = 50
+WAREHOUSES = 200
+ROUNDS = 50
+
+
+def scenario(seed, lines=LINES, warehouses=WAREHOUSES):
+    rng = random.Random(seed)
+    demand = {product_id: rng.randint(1, 20) for product_id in range(1, lines + 1)}
+    stock = {
+        product_id: {warehouse_id: rng.randint(1, 15) for warehouse_id in rng.sample(range(1, warehouses + 1), 60)}
+        for product_id in demand
+    }
+    distances = {warehouse_id: rng.uniform(1, 2000) for warehouse_id in range(1, warehouses + 1)}
+    return demand, stock, distances
+
+
+def main():
+    demand, stock, distances = scenario(1)
+    greedy = timeit.timeit(lambda: allocate(demand, stock, distances, mode='greedy'), number=ROUNDS) / ROUNDS
+    print(f'greedy, {LINES} lines x {WAREHOUSES} warehouses: {greedy * 1e3:7.2f} ms, '
+          f'{len(greedy_warehouses(demand, stock, distances))} shipments')
+
+    small = scenario(2, lines=6)
+    exact = timeit.timeit(lambda: allocate(*small, mode='exact'), number=ROUNDS) / ROUNDS
+    print(f'exact, 6 lines x {WAREHOUSES} warehouses:   {exact * 1e3:7.2f} ms, '
+          f'{len(exact_warehouses(*small))} shipments (greedy {len(greedy_warehouses(*small))})')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""Order creation latency as the customer's order history grows.
+
+Run from the project root against a migrated database with some stock:
+
+    python -m benchmarks.bench_create_order
+
+Creates a throwaway customer, grows its history step by step and times
+create_order (rolled back after every call) next to the old way of finding
+the new header by re-selecting all of the customer's orders. Everything the
+benchmark inserts is deleted at the end.
+"""
+import asyncio
+import time
+
+from sqlalchemy import select, insert, delete, func, text
+
+from database import async_session_maker
+from market.utils import create_order, load_prices
+from models.models import Costumer, OrderDetail, ProductLocation, User
+
+HISTORY_SIZES = [0, 1000, 10000, 100000]
+ROUNDS = 50
+
+
+async def timed(callback, rounds=ROUNDS):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        await callback()
+    return (time.perf_counter() - start) / rounds * 1000
+
+
+async def main():
+    async with async_session_maker() as session:
+        user_id = (await session.execute(select(func.min(User.id)))).scalar_one()
+        product_id, warehouse_id = (await session.execute(
+            select(ProductLocation.product_id, ProductLocation.warehouse_id)
+            .order_by(ProductLocation.product_amount.desc()).limit(1)
+        )).one()
+        costumer_id = (await session.execute(insert(Costumer).values(
+            firstname='bench', lastname='bench', phone=f'bench-{time.time_ns()}', email=f'bench-{time.time_ns()}',
+            user_id=user_id
+        ).returning(Costumer.id))).scalar_one()
+        await session.commit()
+
+        try:
+            lines = [(product_id, warehouse_id, 1)]
+            prices = await load_prices(session, [product_id])
+            history = 0
+            print(f'{"history":>8} {"create_order":>14} {"old header lookup":>19}')
+            for size in HISTORY_SIZES:
+                await session.execute(text(
+                    'INSERT INTO order_detail (costumer, user_id, paid, total_price, created_at, is_active) '
+                    'SELECT :costumer, :user, 0, 0, now() - g * interval \'1 minute\', false '
+                    'FROM generate_series(1, :count) g'
+                ), {'costumer': costumer_id, 'user': user_id, 'count': size - history})
+                await session.commit()
+                history = size
+
+                async def create():
+                    await create_order(session, user_id, costumer_id, lines, prices)
+                    await session.rollback()
+
+                async def old_lookup():
+                    await session.execute(select(OrderDetail).where(
+                        (OrderDetail.user_id == user_id) & (OrderDetail.costumer.has(id=costumer_id))))
+                    await session.rollback()
+
+                print(f'{size:>8} {await timed(create):>11.2f} ms {await timed(old_lookup, 5):>16.2f} ms')
+        finally:
+            await session.rollback()
+            await session.execute(delete(OrderDetail).where(OrderDetail.costumer_id == costumer_id))
+            await session.execute(delete(Costumer).where(Costumer.id == costumer_id))
+            await session.commit()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,98 @@
+"""Orders per second with one commit per order versus the group-commit writer.
+
+Run from the project root against a migrated database with some stock:
+
+    python -m benchmarks.bench_group_commit
+
+Creates a throwaway customer and places ORDERS one-line orders from CONCURRENCY
+concurrent callers, first through create_order with a commit per order (the
+default create-oder path) and then through an OrderWriter. Every order takes
+one unit from the best-stocked locations. The reservations are released
+between the runs and everything the benchmark inserts is deleted at the end.
+"""
+import asyncio
+import random
+import time
+
+from sqlalchemy import select, insert, delete, func
+
+from database import async_session_maker
+from market.ingest import OrderWriter
+from market.utils import create_order, load_prices
+from models.models import Costumer, Order, OrderDetail, ProductLocation, StockReservation, User
+
+ORDERS = 2000
+CONCURRENCY = 200
+BATCH_SIZES = [50, 200]
+
+
+async def run_orders(place, orders):
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+
+    async def bounded(lines):
+        async with semaphore:
+            await place(lines)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[bounded(lines) for lines in orders])
+    return len(orders) / (time.perf_counter() - start)
+
+
+async def release(session, costumer_id):
+    await session.execute(delete(StockReservation).where(StockReservation.order_detail_id.in_(
+        select(OrderDetail.id).where(OrderDetail.costumer_id == costumer_id)
+    )))
+    await session.commit()
+
+
+async def main():
+    async with async_session_maker() as session:
+        user_id = (await session.execute(select(func.min(User.id)))).scalar_one()
+        locations = (await session.execute(
+            select(ProductLocation.product_id, ProductLocation.warehouse_id, ProductLocation.product_amount)
+            .order_by(ProductLocation.product_amount.desc()).limit(ORDERS)
+        )).all()
+        units = [(product_id, warehouse_id) for product_id, warehouse_id, amount in locations for _ in range(amount)]
+        random.Random(0).shuffle(units)
+        orders = [[(product_id, warehouse_id, 1)] for product_id, warehouse_id in units[:ORDERS]]
+        prices = await load_prices(session, {product_id for product_id, _ in units[:ORDERS]})
+        costumer_id = (await session.execute(insert(Costumer).values(
+            firstname='bench', lastname='bench', phone=f'bench-{time.time_ns()}', email=f'bench-{time.time_ns()}',
+            user_id=user_id
+        ).returning(Costumer.id))).scalar_one()
+        await session.commit()
+
+        try:
+            async def per_request(lines):
+                async with async_session_maker() as order_session:
+                    await create_order(order_session, user_id, costumer_id, lines, prices)
+                    await order_session.commit()
+
+            print(f'{len(orders)} orders, {CONCURRENCY} concurrent callers')
+            print(f'{"commit per order":>24} {await run_orders(per_request, orders):>8.0f} orders/s')
+            await release(session, costumer_id)
+
+            for batch_size in BATCH_SIZES:
+                writer = OrderWriter(batch_size=batch_size)
+                writer.start()
+                try:
+                    rate = await run_orders(lambda lines: writer.submit(user_id, costumer_id, lines, prices), orders)
+                finally:
+                    await writer.stop()
+                status = writer.status()
+                print(f'{f"group commit, batch {batch_size}":>24} {rate:>8.0f} orders/s '
+                      f'({status["batches"]} batches, {status["failed"]} failed)')
+                await release(session, costumer_id)
+        finally:
+            await session.rollback()
+            await release(session, costumer_id)
+            await session.execute(delete(Order).where(Order.order_detail_id.in_(
+                select(OrderDetail.id).where(OrderDetail.costumer_id == costumer_id)
+            )))
+            await session.execute(delete(OrderDetail).where(OrderDetail.costumer_id == costumer_id))
+            await session.execute(delete(Costumer).where(Costumer.id == costumer_id))
+            await session.commit()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,30 @@
+"""Per-request auth overhead: full jwt.decode versus the verified-token cache.
+
+Run from the project root: python -m benchmarks.bench_verify_token
+"""
+import os
+import timeit
+
+os.environ.setdefault('SECRET', 'benchmark-secret')
+
+import jwt
+
+from accounts.utils import generate_token, decode_token
+
+ROUNDS = 20000
+
+
+def main():
+    token = generate_token(1, ['admin'], 1)['access_token']
+
+    uncached = timeit.timeit(lambda: jwt.decode(token, os.environ.get('SECRET'), algorithms=['HS256']), number=ROUNDS)
+    decode_token(token)
+    cached = timeit.timeit(lambda: decode_token(token), number=ROUNDS)
+
+    print(f'jwt.decode per call:   {uncached / ROUNDS * 1e6:8.2f} us')
+    print(f'decode_token (cached): {cached / ROUNDS * 1e6:8.2f} us')
+    print(f'speedup:               {uncached / cached:8.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -6,5 +6,42 @@ POSTGRES_DB = os.getenv("POSTGRES_DB")
 POSTGRES_USER = os.getenv("POSTGRES_USER")
 POSTGRES_PASSWORD = os.getenv("POSTGRES_PASSWORD")
 POSTGRES_HOST = os.getenv("POSTGRES_HOST")
-POSTGRES_PORT = os.getenv("POSTGRES_PORT")
-SECRET = os.environ.get('SECRET')
\ No newline at end of file
+POSTGRES_PORT = os.getenv("POSTGRES_PORT", "5432")
+SECRET = os.environ.get('SECRET')
+ROLE_CACHE_TTL = int(os.getenv("ROLE_CACHE_TTL", 60))
+TOKEN_ROLE_CLAIMS = os.getenv("TOKEN_ROLE_CLAIMS", "false").lower() in ("1", "true", "yes")
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", 4))
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", 64))
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", 10000))
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", -1))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "false").lower() in ("1", "true", "yes")
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", 100))
+DB_REPLICA_URLS = [url.strip() for url in os.getenv("DB_REPLICA_URLS", "").split(",") if url.strip()]
+DB_REPLICA_RETRY_SECONDS = float(os.getenv("DB_REPLICA_RETRY_SECONDS", 30))
+DEBUG = os.getenv("DEBUG", "false").lower() in ("1", "true", "yes")
+SQL_REPEAT_THRESHOLD = int(os.getenv("SQL_REPEAT_THRESHOLD", 10))
+PAGE_DEFAULT_LIMIT = int(os.getenv("PAGE_DEFAULT_LIMIT", 100))
+PAGE_MAX_LIMIT = int(os.getenv("PAGE_MAX_LIMIT", 1000))
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", 10000))
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 1000))
+HISTORY_PARTITIONS_AHEAD = int(os.getenv("HISTORY_PARTITIONS_AHEAD", 3))
+HISTORY_RETAIN_MONTHS = int(os.getenv("HISTORY_RETAIN_MONTHS", 24))
+HISTORY_ARCHIVE_DIR = os.getenv("HISTORY_ARCHIVE_DIR")
+WAREHOUSE_INDEX_TTL = int(os.getenv("WAREHOUSE_INDEX_TTL", 300))
+ALLOCATION_EXACT_MAX_LINES = int(os.getenv("ALLOCATION_EXACT_MAX_LINES", 8))
+ALLOCATION_EXACT_NODE_LIMIT = int(os.getenv("ALLOCATION_EXACT_NODE_LIMIT", 2000))
+RESERVATION_TTL_SECONDS = int(os.getenv("RESERVATION_TTL_SECONDS", 900))
+RESERVATION_SWEEP_INTERVAL = float(os.getenv("RESERVATION_SWEEP_INTERVAL", 30))
+RESERVATION_SWEEP_BATCH = int(os.getenv("RESERVATION_SWEEP_BATCH", 1000))
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", 86400))
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", 10000))
+IDEMPOTENCY_SWEEP_INTERVAL = float(os.getenv("IDEMPOTENCY_SWEEP_INTERVAL", 300))
+IDEMPOTENCY_SWEEP_BATCH = int(os.getenv("IDEMPOTENCY_SWEEP_BATCH", 5000))
+PRODUCTION_CACHE_TTL = int(os.getenv("PRODUCTION_CACHE_TTL", 60))
+ORDER_GROUP_COMMIT = os.getenv("ORDER_GROUP_COMMIT", "false").lower() in ("1", "true", "yes")
+ORDER_BATCH_SIZE = int(os.getenv("ORDER_BATCH_SIZE", 200))
+ORDER_BATCH_MAX_WAIT = float(os.getenv("ORDER_BATCH_MAX_WAIT", 0.005))
+ORDER_QUEUE_MAX = int(os.getenv("ORDER_QUEUE_MAX", 5000))
@@ -1,17 +1,191 @@
+import asyncio
+import itertools
+import logging
+import time
 
+from sqlalchemy import event
+from sqlalchemy.exc import DBAPIError, TimeoutError as PoolTimeoutError
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from typing import AsyncGenerator
 
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from config import POSTGRES_DB, POSTGRES_USER, POSTGRES_PASSWORD,  POSTGRES_HOST, POSTGRES_PORT
+from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from config import POSTGRES_DB, POSTGRES_USER, POSTGRES_PASSWORD,  POSTGRES_HOST, POSTGRES_PORT, DB_POOL_SIZE, \
+    DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PRE_PING, DB_STATEMENT_CACHE_SIZE, DB_REPLICA_URLS, \
+    DB_REPLICA_RETRY_SECONDS
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """Queue pool that records how long callers wait for a connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_stats = {'checkouts': 0, 'timeouts': 0, 'total_wait': 0.0, 'max_wait': 0.0}
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            self.wait_stats['timeouts'] += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            self.wait_stats['checkouts'] += 1
+            self.wait_stats['total_wait'] += waited
+            self.wait_stats['max_wait'] = max(self.wait_stats['max_wait'], waited)
+
+
+def create_db_engine(url: str):
+    connect_args = {}
+    if url.startswith('postgresql+asyncpg'):
+        connect_args['prepared_statement_cache_size'] = DB_STATEMENT_CACHE_SIZE
+    return create_async_engine(
+        url,
+        poolclass=InstrumentedPool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        connect_args=connect_args,
+    )
+
 
 DB_URL = f"postgresql+asyncpg://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
-engine = create_async_engine(DB_URL)
+engine = create_db_engine(DB_URL)
 async_session_maker = sessionmaker(engine, class_=AsyncSession, expire_on_commit=True)
 Base = declarative_base()
 
+replica_engines = []
+_replica_session_makers = []
+_replica_down_until = []
+_replica_cycle = itertools.cycle([])
+
+_write_listeners = []
+
+
+def configure_replicas(urls):
+    """Bind the read-session dependency to ``urls``; an empty list routes reads to the primary."""
+    global _replica_cycle
+    replica_engines[:] = [create_db_engine(url) for url in urls]
+    _replica_session_makers[:] = [
+        sessionmaker(replica_engine, class_=AsyncSession, expire_on_commit=True) for replica_engine in replica_engines
+    ]
+    _replica_down_until[:] = [0.0] * len(replica_engines)
+    _replica_cycle = itertools.cycle(range(len(replica_engines)))
+
+
+configure_replicas(DB_REPLICA_URLS)
+
 
 async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
     async with async_session_maker() as session:
         yield session
+
+
+async def open_read_session() -> AsyncSession:
+    """Open a session on the next healthy replica in round-robin order, falling back to the primary."""
+    for _ in range(len(_replica_session_makers)):
+        index = next(_replica_cycle)
+        if _replica_down_until[index] > time.monotonic():
+            continue
+        session = _replica_session_makers[index]()
+        try:
+            await session.connection()
+            return session
+        except (OSError, DBAPIError, PoolTimeoutError):
+            _replica_down_until[index] = time.monotonic() + DB_REPLICA_RETRY_SECONDS
+            await session.close()
+    return async_session_maker()
+
+
+async def get_async_read_session() -> AsyncGenerator[AsyncSession, None]:
+    async with await open_read_session() as session:
+        yield session
+
+
+def pool_stats(db_engine=engine):
+    pool = db_engine.pool
+    wait_stats = getattr(pool, 'wait_stats', {})
+    checkouts = wait_stats.get('checkouts', 0)
+    return {
+        'size': pool.size(),
+        'checked_out': pool.checkedout(),
+        'checked_in': pool.checkedin(),
+        'overflow': max(pool.overflow(), 0),
+        'max_overflow': DB_MAX_OVERFLOW,
+        'timeout': DB_POOL_TIMEOUT,
+        'checkouts': checkouts,
+        'timeouts': wait_stats.get('timeouts', 0),
+        'avg_wait_ms': wait_stats.get('total_wait', 0.0) / checkouts * 1000 if checkouts else 0.0,
+        'max_wait_ms': wait_stats.get('max_wait', 0.0) * 1000,
+    }
+
+
+def replica_pool_stats():
+    return [
+        {**pool_stats(replica_engine), 'down': _replica_down_until[index] > time.monotonic()}
+        for index, replica_engine in enumerate(replica_engines)
+    ]
+
+
+async def run_batched_cleanup(delete_batch, interval: float, batch_size: int, logger: logging.Logger):
+    """Every ``interval`` seconds call ``delete_batch(session, batch_size)`` until it removes fewer rows.
+
+    Each batch is committed on its own session so cleanup never holds locks on a large set of rows.
+    """
+    while True:
+        try:
+            deleted = batch_size
+            while deleted == batch_size:
+                async with async_session_maker() as session:
+                    deleted = await delete_batch(session, batch_size)
+                    await session.commit()
+                if deleted:
+                    logger.info('deleted %s rows', deleted)
+        except Exception:
+            logger.exception('cleanup failed')
+        await asyncio.sleep(interval)
+
+
+def on_table_write(models, callback):
+    """Call ``callback`` when a session writes to any of ``models`` and again after that session commits."""
+    _write_listeners.append(({model.__tablename__ for model in models}, callback))
+
+
+def _notify_write(session, table_names):
+    if not table_names:
+        return
+    session.info.setdefault('written_tables', set()).update(table_names)
+    for names, callback in _write_listeners:
+        if names & table_names:
+            callback()
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _track_statement_writes(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, 'table', None)
+        if table is not None:
+            _notify_write(orm_execute_state.session, {table.name})
+
+
+@event.listens_for(Session, 'after_flush')
+def _track_flush_writes(session, flush_context):
+    objects = list(session.new) + list(session.dirty) + list(session.deleted)
+    _notify_write(session, {obj.__tablename__ for obj in objects if hasattr(obj, '__tablename__')})
+
+
+@event.listens_for(Session, 'after_commit')
+def _notify_committed_writes(session):
+    table_names = session.info.pop('written_tables', set())
+    for names, callback in _write_listeners:
+        if names & table_names:
+            callback()
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _forget_rolled_back_writes(session, previous_transaction):
+    session.info.pop('written_tables', None)
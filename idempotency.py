@@ -0,0 +1,176 @@
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Union
+
+from fastapi import Depends, Header, HTTPException, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from sqlalchemy import event, select, update, delete, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from accounts.utils import decode_token
+from config import IDEMPOTENCY_TTL_SECONDS, IDEMPOTENCY_CACHE_SIZE, IDEMPOTENCY_SWEEP_INTERVAL, \
+    IDEMPOTENCY_SWEEP_BATCH
+from database import run_batched_cleanup
+from models.models import IdempotencyRecord
+
+logger = logging.getLogger('idempotency')
+
+_response_cache = OrderedDict()
+_optional_bearer = HTTPBearer(auto_error=False)
+
+
+def _cache_get(cache_key):
+    entry = _response_cache.get(cache_key)
+    if entry is None:
+        return None
+    if entry[0] <= time.time():
+        _response_cache.pop(cache_key, None)
+        return None
+    _response_cache.move_to_end(cache_key)
+    return entry
+
+
+def _cache_put(cache_key, entry):
+    _response_cache[cache_key] = entry
+    _response_cache.move_to_end(cache_key)
+    if len(_response_cache) > IDEMPOTENCY_CACHE_SIZE:
+        _response_cache.popitem(last=False)
+
+
+@event.listens_for(Session, 'after_commit')
+def _cache_committed_responses(session):
+    for cache_key, entry in session.info.pop('idempotent_responses', {}).items():
+        _cache_put(cache_key, entry)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _forget_rolled_back_responses(session, previous_transaction):
+    session.info.pop('idempotent_responses', None)
+
+
+class IdempotencyKey:
+    """``Idempotency-Key`` header support for write endpoints.
+
+    ``begin`` claims the key inside the endpoint's transaction and returns the stored response when the request
+    was already handled. ``finish`` stores the response in the same transaction, so the work and its recorded
+    result commit or roll back together. A retry racing the first request waits on the key's row and then
+    replays its result; errors are not stored, so a failed request can be retried with the same key.
+
+    Keys are scoped to the caller's user id (0 without a bearer token), so two users sending the same key never
+    see each other's responses.
+    """
+
+    def __init__(
+            self,
+            request: Request,
+            key: Union[str, None] = Header(None, alias='Idempotency-Key', max_length=255),
+            credentials: Union[HTTPAuthorizationCredentials, None] = Depends(_optional_bearer)
+    ):
+        self.request = request
+        self.key = key
+        self.credentials = credentials
+        self.endpoint = None
+        self.user_id = 0
+        self.request_hash = None
+
+    async def _fingerprint(self) -> str:
+        digest = hashlib.sha256()
+        digest.update(self.request.url.path.encode())
+        digest.update(str(sorted(self.request.query_params.multi_items())).encode())
+        digest.update(await self.request.body())
+        return digest.hexdigest()
+
+    def _replay(self, request_hash, status_code, body):
+        if request_hash != self.request_hash:
+            raise HTTPException(status_code=422, detail='Idempotency-Key was already used for a different request')
+        return JSONResponse(content=body, status_code=status_code, headers={'Idempotent-Replayed': 'true'})
+
+    def _scope(self):
+        return (IdempotencyRecord.endpoint == self.endpoint) & (IdempotencyRecord.user_id == self.user_id) & \
+            (IdempotencyRecord.key == self.key)
+
+    async def begin(self, session, endpoint: str, claim: bool = True):
+        """Return the stored response for a repeated key, or ``None`` when the caller should do the work.
+
+        With ``claim=False`` only the in-process cache is checked and the caller hands the key to the transaction
+        that does the work, which calls ``claim`` itself.
+        """
+        if self.key is None:
+            return None
+        self.endpoint = endpoint
+        if self.credentials is not None:
+            self.user_id = decode_token(self.credentials.credentials)['user_id']
+        self.request_hash = await self._fingerprint()
+        cached = _cache_get((endpoint, self.user_id, self.key))
+        if cached is not None:
+            return self._replay(*cached[1:])
+        return await self.claim(session) if claim else None
+
+    async def claim(self, session):
+        """Claim the key in ``session``'s transaction; returns the stored response when it was already used."""
+        now = datetime.utcnow()
+        query = pg_insert(IdempotencyRecord).values(
+            endpoint=self.endpoint, user_id=self.user_id, key=self.key, request_hash=self.request_hash,
+            expires_at=now + timedelta(seconds=IDEMPOTENCY_TTL_SECONDS)
+        )
+        query = query.on_conflict_do_update(
+            index_elements=[IdempotencyRecord.endpoint, IdempotencyRecord.user_id, IdempotencyRecord.key],
+            set_={
+                'request_hash': query.excluded.request_hash, 'expires_at': query.excluded.expires_at,
+                'status_code': None, 'response': None
+            },
+            where=IdempotencyRecord.expires_at <= now
+        ).returning(IdempotencyRecord.key)
+        if (await session.execute(query)).scalar_one_or_none() is not None:
+            return None
+
+        stored = (await session.execute(select(
+            IdempotencyRecord.request_hash, IdempotencyRecord.status_code, IdempotencyRecord.response,
+            IdempotencyRecord.expires_at
+        ).where(self._scope()))).one()
+        if stored.status_code is None:
+            # Claimed earlier in this same transaction, e.g. a retry queued into the same order batch.
+            raise HTTPException(status_code=409, detail='A request with this Idempotency-Key is still in progress')
+        expires = time.time() + (stored.expires_at - now).total_seconds()
+        _cache_put((self.endpoint, self.user_id, self.key),
+                   (expires, stored.request_hash, stored.status_code, stored.response))
+        return self._replay(stored.request_hash, stored.status_code, stored.response)
+
+    async def release(self, session):
+        """Drop the claim of a request that failed in a transaction that still commits, so the key can be retried."""
+        await session.execute(delete(IdempotencyRecord).where(self._scope()),
+                              execution_options={'synchronize_session': False})
+
+    async def finish(self, session, response: dict, status_code: int = 200) -> dict:
+        """Record ``response`` for the claimed key; it is cached in-process once the caller commits."""
+        if self.key is None:
+            return response
+        body = jsonable_encoder(response)
+        await session.execute(update(IdempotencyRecord).where(self._scope()).values(
+            status_code=status_code, response=body
+        ), execution_options={'synchronize_session': False})
+        session.info.setdefault('idempotent_responses', {})[(self.endpoint, self.user_id, self.key)] = (
+            time.time() + IDEMPOTENCY_TTL_SECONDS, self.request_hash, status_code, body
+        )
+        return response
+
+
+async def delete_expired_keys(session, batch_size: int = IDEMPOTENCY_SWEEP_BATCH) -> int:
+    expired = select(IdempotencyRecord.endpoint, IdempotencyRecord.user_id, IdempotencyRecord.key).where(
+        IdempotencyRecord.expires_at <= datetime.utcnow()
+    ).limit(batch_size).with_for_update(skip_locked=True)
+    result = await session.execute(delete(IdempotencyRecord).where(
+        tuple_(IdempotencyRecord.endpoint, IdempotencyRecord.user_id, IdempotencyRecord.key).in_(expired)
+    ), execution_options={'synchronize_session': False})
+    return result.rowcount
+
+
+async def sweep_expired_keys(interval: float = IDEMPOTENCY_SWEEP_INTERVAL, batch_size: int = IDEMPOTENCY_SWEEP_BATCH):
+    """Delete expired keys every ``interval`` seconds in batches of ``batch_size``."""
+    await run_batched_cleanup(delete_expired_keys, interval, batch_size, logger)
@@ -0,0 +1,82 @@
+import logging
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from config import DEBUG, SQL_REPEAT_THRESHOLD
+
+logger = logging.getLogger('sql.requests')
+
+_request_stats: ContextVar = ContextVar('request_sql_stats', default=None)
+_placeholder = re.compile(r'\$\d+(?:::\w+)?|%\(\w+\)s|(?<!:):\w+|\?')
+_placeholder_list = re.compile(r'\?(?:\s*,\s*\?)+')
+
+
+class RequestQueryStats:
+    def __init__(self):
+        self.count = 0
+        self.total_time = 0.0
+        self.slowest_time = 0.0
+        self.slowest_statement = None
+        self.shapes = Counter()
+
+    def record(self, statement, elapsed):
+        self.count += 1
+        self.total_time += elapsed
+        if elapsed > self.slowest_time:
+            self.slowest_time = elapsed
+            self.slowest_statement = statement
+        self.shapes[statement_shape(statement)] += 1
+
+    def repeated(self):
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= SQL_REPEAT_THRESHOLD]
+
+
+def statement_shape(statement: str) -> str:
+    shape = _placeholder.sub('?', statement)
+    shape = _placeholder_list.sub('?', shape)
+    return ' '.join(shape.split())
+
+
+# The start time lives on the statement's execution context, which is dropped with it whether or not the
+# statement succeeds; a per-connection stack kept an entry for every statement that raised.
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._query_start_time = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = context._query_start_time
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.record(statement, time.perf_counter() - start)
+
+
+async def sql_stats_middleware(request, call_next):
+    stats = RequestQueryStats()
+    token = _request_stats.set(stats)
+    try:
+        response = await call_next(request)
+    finally:
+        _request_stats.reset(token)
+    repeated = stats.repeated()
+    if DEBUG:
+        response.headers['X-DB-Queries'] = str(stats.count)
+        response.headers['X-DB-Time-Ms'] = f'{stats.total_time * 1000:.2f}'
+        response.headers['X-DB-Slowest-Ms'] = f'{stats.slowest_time * 1000:.2f}'
+        if repeated:
+            response.headers['X-DB-Repeated-Statements'] = str(repeated[0][1])
+    else:
+        logger.info(
+            '%s %s: %d queries, %.2f ms total, slowest %.2f ms: %s',
+            request.method, request.url.path, stats.count, stats.total_time * 1000,
+            stats.slowest_time * 1000, (stats.slowest_statement or '')[:200]
+        )
+    for shape, count in repeated:
+        logger.warning('%s %s ran the same statement %d times: %s', request.method, request.url.path, count, shape[:200])
+    return response
@@ -0,0 +1,22 @@
+from fastapi import APIRouter
+
+from accounts.utils import hash_pool_stats
+from database import pool_stats, replica_pool_stats
+from market.ingest import order_writer
+
+internal_router = APIRouter()
+
+
+@internal_router.get('/password-hash')
+async def password_hash_pool():
+    return hash_pool_stats()
+
+
+@internal_router.get('/db-pool')
+async def db_pool():
+    return {**pool_stats(), 'replicas': replica_pool_stats()}
+
+
+@internal_router.get('/order-writer')
+async def order_writer_status():
+    return order_writer.status()
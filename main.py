@@ -1,12 +1,40 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+
+from config import RESERVATION_SWEEP_INTERVAL, IDEMPOTENCY_SWEEP_INTERVAL, ORDER_GROUP_COMMIT
+from idempotency import sweep_expired_keys
+from instrumentation import sql_stats_middleware
+from market.ingest import order_writer
 from market.market import market_router
 from accounts.accounts import account_router
 from warehouse.warehouse import warehouse_router
+from internal.internal import internal_router
+from warehouse.reservations import sweep_expired_reservations
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    sweepers = []
+    if RESERVATION_SWEEP_INTERVAL > 0:
+        sweepers.append(asyncio.create_task(sweep_expired_reservations()))
+    if IDEMPOTENCY_SWEEP_INTERVAL > 0:
+        sweepers.append(asyncio.create_task(sweep_expired_keys()))
+    if ORDER_GROUP_COMMIT:
+        order_writer.start()
+    yield
+    await order_writer.stop()
+    for sweeper in sweepers:
+        sweeper.cancel()
+
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+app.middleware('http')(sql_stats_middleware)
 app.include_router(market_router, prefix="/market")
 app.include_router(account_router, prefix="/accounts")
 app.include_router(warehouse_router, prefix='/warehouse')
+app.include_router(internal_router, prefix='/internal')
 
 
 @app.get("/")
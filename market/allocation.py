@@ -0,0 +1,167 @@
+import math
+from datetime import datetime
+
+import numpy as np
+from fastapi import HTTPException
+from sqlalchemy import select, func
+
+from config import ALLOCATION_EXACT_MAX_LINES, ALLOCATION_EXACT_NODE_LIMIT
+from models.models import ProductLocation, StockReservation
+from warehouse.spatial import get_warehouse_index, to_unit_vector, chord_to_km
+
+
+async def load_stock(session, product_ids) -> dict:
+    """Return ``{product_id: {warehouse_id: amount}}`` of unreserved stock for ``product_ids``."""
+    product_ids = list(product_ids)
+    reserved = select(
+        StockReservation.product_id, StockReservation.warehouse_id, func.sum(StockReservation.amount).label('amount')
+    ).where(
+        StockReservation.product_id.in_(product_ids) & (StockReservation.expires_at > datetime.utcnow())
+    ).group_by(StockReservation.product_id, StockReservation.warehouse_id).subquery()
+    available = ProductLocation.product_amount - func.coalesce(reserved.c.amount, 0)
+    query = select(ProductLocation.product_id, ProductLocation.warehouse_id, available).outerjoin(
+        reserved,
+        (reserved.c.product_id == ProductLocation.product_id) & (reserved.c.warehouse_id == ProductLocation.warehouse_id)
+    ).where(ProductLocation.product_id.in_(product_ids) & (available > 0))
+    stock = {product_id: {} for product_id in product_ids}
+    for product_id, warehouse_id, amount in (await session.execute(query)).all():
+        stock[product_id][warehouse_id] = amount
+    return stock
+
+
+async def warehouse_distances(session, warehouse_ids, latitude=None, longitude=None) -> dict:
+    """Return ``{warehouse_id: km}`` from a delivery point.
+
+    Without a point every warehouse is equally far; warehouses without coordinates are ranked last.
+    """
+    if latitude is None or longitude is None:
+        return {}
+    index = await get_warehouse_index(session)
+    target = to_unit_vector(latitude, longitude)
+    return {
+        warehouse_id: chord_to_km(sum((a - b) ** 2 for a, b in zip(index.points[warehouse_id][:3], target)))
+        if warehouse_id in index.points else math.inf
+        for warehouse_id in warehouse_ids
+    }
+
+
+def check_shortages(demand: dict, stock: dict):
+    shortages = {
+        product_id: {'requested': quantity, 'available': sum(stock.get(product_id, {}).values())}
+        for product_id, quantity in demand.items()
+        if sum(stock.get(product_id, {}).values()) < quantity
+    }
+    if shortages:
+        raise HTTPException(status_code=400, detail={'message': 'Product is not enough', 'shortages': shortages})
+
+
+def assign(demand: dict, stock: dict, warehouses, distances: dict) -> list:
+    """Fill each line from ``warehouses`` nearest first; returns ``(product_id, warehouse_id, count)`` rows."""
+    ordered = sorted(warehouses, key=lambda warehouse_id: (distances.get(warehouse_id, 0.0), warehouse_id))
+    rows = []
+    for product_id, quantity in demand.items():
+        available = stock.get(product_id, {})
+        for warehouse_id in ordered:
+            if quantity <= 0:
+                break
+            count = min(quantity, available.get(warehouse_id, 0))
+            if count > 0:
+                rows.append((product_id, warehouse_id, count))
+                quantity -= count
+    return rows
+
+
+def greedy_warehouses(demand: dict, stock: dict, distances: dict) -> list:
+    """Pick warehouses one at a time, preferring the one that completes the most lines, then ships the most units."""
+    products = list(demand)
+    warehouses = sorted({warehouse_id for product_id in products for warehouse_id in stock.get(product_id, {})})
+    column = {warehouse_id: position for position, warehouse_id in enumerate(warehouses)}
+    levels = np.zeros((len(warehouses), len(products)), dtype=np.int64)
+    for position, product_id in enumerate(products):
+        for warehouse_id, amount in stock.get(product_id, {}).items():
+            levels[column[warehouse_id], position] = amount
+    remaining = np.array([demand[product_id] for product_id in products], dtype=np.int64)
+    distance = np.array([distances.get(warehouse_id, 0.0) for warehouse_id in warehouses])
+
+    chosen = []
+    while remaining.any():
+        covered = np.minimum(levels, remaining)
+        units = covered.sum(axis=1)
+        completed = ((levels >= remaining) & (remaining > 0)).sum(axis=1)
+        best = np.lexsort((distance, -units, -completed))[0]
+        if units[best] == 0:
+            break
+        chosen.append(warehouses[best])
+        remaining -= covered[best]
+        levels[best] = 0
+    return chosen
+
+
+def exact_warehouses(demand: dict, stock: dict, distances: dict, node_limit: int = ALLOCATION_EXACT_NODE_LIMIT):
+    """Branch and bound over warehouse sets for the fewest shipments, then the shortest total distance.
+
+    Each level branches on the unfilled line with the fewest candidate warehouses; siblings exclude the warehouses
+    already tried, so every set is visited once. The greedy choice seeds the bound and is kept if ``node_limit``
+    runs out.
+    """
+    best = greedy_warehouses(demand, stock, distances)
+    best_cost = (len(best), sum(distances.get(warehouse_id, 0.0) for warehouse_id in best))
+    nodes = 0
+
+    def search(chosen, remaining, excluded, total):
+        nonlocal best, best_cost, nodes
+        nodes += 1
+        open_lines = [product_id for product_id, quantity in remaining.items() if quantity > 0]
+        if not open_lines:
+            if (len(chosen), total) < best_cost:
+                best, best_cost = list(chosen), (len(chosen), total)
+            return
+        if (len(chosen) + 1, total) >= best_cost or nodes >= node_limit:
+            return
+        candidates = {
+            product_id: [
+                warehouse_id for warehouse_id in stock.get(product_id, {})
+                if warehouse_id not in excluded and warehouse_id not in chosen
+            ]
+            for product_id in open_lines
+        }
+        product_id = min(open_lines, key=lambda item: len(candidates[item]))
+        tried = set()
+        for warehouse_id in sorted(candidates[product_id], key=lambda item: (distances.get(item, 0.0), item)):
+            if (len(chosen) + 1, total + distances.get(warehouse_id, 0.0)) >= best_cost:
+                # Candidates are sorted by distance, so every remaining sibling is at least as expensive.
+                break
+            following = {
+                item: max(0, quantity - stock.get(item, {}).get(warehouse_id, 0)) for item, quantity in remaining.items()
+            }
+            chosen.append(warehouse_id)
+            search(chosen, following, excluded | tried, total + distances.get(warehouse_id, 0.0))
+            chosen.pop()
+            tried.add(warehouse_id)
+
+    search([], dict(demand), frozenset(), 0.0)
+    return best
+
+
+def allocate(demand: dict, stock: dict, distances: dict, mode: str = 'auto') -> list:
+    """Split ``{product_id: quantity}`` across warehouses; returns ``(product_id, warehouse_id, count)`` rows."""
+    check_shortages(demand, stock)
+    if mode == 'exact' or (mode == 'auto' and len(demand) <= ALLOCATION_EXACT_MAX_LINES):
+        warehouses = exact_warehouses(demand, stock, distances)
+    else:
+        warehouses = greedy_warehouses(demand, stock, distances)
+    return assign(demand, stock, warehouses, distances)
+
+
+def shipment_summary(rows, distances: dict) -> dict:
+    warehouses = {warehouse_id for _, warehouse_id, _ in rows}
+    total = sum(distances.get(warehouse_id, 0.0) for warehouse_id in warehouses)
+    return {'shipments': len(warehouses), 'distance_km': total if math.isfinite(total) else None}
+
+
+async def allocate_order(session, demand: dict, latitude=None, longitude=None, mode: str = 'auto'):
+    """Batch-load stock and distances for ``demand`` and allocate it; returns the rows and the distances used."""
+    stock = await load_stock(session, demand)
+    warehouse_ids = {warehouse_id for levels in stock.values() for warehouse_id in levels}
+    distances = await warehouse_distances(session, warehouse_ids, latitude, longitude)
+    return allocate(demand, stock, distances, mode), distances
@@ -0,0 +1,142 @@
+import asyncio
+import logging
+
+from fastapi import HTTPException
+
+from config import ORDER_BATCH_SIZE, ORDER_BATCH_MAX_WAIT, ORDER_QUEUE_MAX
+from database import async_session_maker
+from market.utils import create_orders
+
+logger = logging.getLogger('market.ingest')
+
+
+class OrderWriter:
+    """Group commit for ``create-oder``: validated orders are queued and written in micro-batches.
+
+    A batch closes when it holds ``batch_size`` orders or ``max_wait`` seconds after its first order arrived. It
+    is written by ``create_orders`` and committed once, then every caller's future resolves with its own result.
+    A shortage only rejects the order it belongs to; when a batch fails in the database its orders are retried one
+    at a time, so an error reaches only the caller that caused it. An order's ``Idempotency-Key`` is claimed and its
+    response recorded in the batch's transaction, never in the caller's.
+    """
+
+    def __init__(self, batch_size: int = ORDER_BATCH_SIZE, max_wait: float = ORDER_BATCH_MAX_WAIT,
+                 max_queue: int = ORDER_QUEUE_MAX, session_maker=async_session_maker):
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+        self.session_maker = session_maker
+        self.queue = None
+        self.task = None
+        self.stats = {'orders': 0, 'batches': 0, 'rejected': 0, 'failed': 0}
+
+    def start(self):
+        self.queue = asyncio.Queue()
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """Stop the writer; orders still queued fail with a 503."""
+        if self.task is None:
+            return
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        self.task = None
+        queued = []
+        while not self.queue.empty():
+            queued.append(self.queue.get_nowait())
+        self.fail(queued, HTTPException(status_code=503, detail='Order writer stopped'))
+
+    @staticmethod
+    def fail(batch, error):
+        for *_, future in batch:
+            if not future.done():
+                future.set_exception(error)
+
+    async def submit(self, user_id: int, costumer_id: int, lines, prices: dict, paid: float = 0,
+                     idempotency=None, response: dict = None):
+        """Queue an order; returns ``(order_detail_id, total_price, reserved_until)`` once its batch commits.
+
+        With a begun ``idempotency`` key, ``response`` is what gets recorded for it, and a key that was already used
+        returns its stored response instead.
+        """
+        if self.task is None:
+            raise HTTPException(status_code=503, detail='Order writer is not running')
+        if self.queue.qsize() >= self.max_queue:
+            self.stats['rejected'] += 1
+            raise HTTPException(status_code=503, detail='Server is busy, try again later')
+        future = asyncio.get_running_loop().create_future()
+        keyed = (idempotency, response) if idempotency is not None and idempotency.key is not None else None
+        self.queue.put_nowait(((user_id, costumer_id, lines, prices, paid), keyed, future))
+        return await future
+
+    async def next_batch(self) -> list:
+        batch = [await self.queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait
+        try:
+            while len(batch) < self.batch_size:
+                if not self.queue.empty():
+                    batch.append(self.queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+        except asyncio.CancelledError:
+            self.fail(batch, HTTPException(status_code=503, detail='Order writer stopped'))
+            raise
+        return batch
+
+    async def write(self, batch):
+        orders = [order for order, _, _ in batch]
+        keys = [keyed for _, keyed, _ in batch]
+        try:
+            async with self.session_maker() as session:
+                results = await create_orders(session, orders, keys)
+                await session.commit()
+        except asyncio.CancelledError:
+            self.fail(batch, HTTPException(status_code=503, detail='Order writer stopped'))
+            raise
+        except Exception as error:
+            if len(batch) > 1:
+                # One bad order, e.g. an unknown customer, must not fail the others: retry them one by one.
+                logger.warning('order batch of %s failed, writing its orders one at a time', len(batch))
+                for item in batch:
+                    await self.write([item])
+                return
+            self.stats['failed'] += 1
+            logger.exception('order failed')
+            self.fail(batch, error)
+            return
+        self.stats['orders'] += len(batch)
+        self.stats['batches'] += 1
+        for (*_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    async def run(self):
+        while True:
+            await self.write(await self.next_batch())
+
+    def status(self) -> dict:
+        return {
+            'running': self.task is not None,
+            'batch_size': self.batch_size,
+            'max_wait': self.max_wait,
+            'max_queue': self.max_queue,
+            'queue_depth': self.queue.qsize() if self.queue is not None else 0,
+            **self.stats
+        }
+
+
+order_writer = OrderWriter()
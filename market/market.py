@@ -1,16 +1,24 @@
 from datetime import datetime
-from typing import List
-from fastapi import HTTPException, APIRouter, Depends
+from typing import List, Union, Literal
+from fastapi import HTTPException, APIRouter, Depends, Response, Query
 from sqlalchemy import select, update, insert, delete, and_
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
 from accounts.utils import verify_token
-from database import get_async_session
+from database import get_async_session, get_async_read_session
+from config import ORDER_GROUP_COMMIT, PAGE_DEFAULT_LIMIT, PAGE_MAX_LIMIT
+from idempotency import IdempotencyKey
+from market.allocation import allocate_order, shipment_summary
+from market.ingest import order_writer
+from market.production import get_production_capacity, recipe_requirements, start_production
+from market.utils import load_prices, create_order, confirm_order_detail, user_warehouse
 from market.scheme import ProductGetScheme, ProductAddScheme, ProductUpdateScheme, CategoryScheme, CategoryAddScheme, \
     OrderScheme, CompositeAddScheme, EndProcessScheme, ReportGetScheme, ResourceGetScheme, ResourceScheme, \
-    ResourceAddScheme, UnitScheme, UnitAddScheme, CreateRecipeScheme
+    ResourceAddScheme, UnitScheme, UnitAddScheme, CreateRecipeScheme, ClientOrderScheme, \
+    ProducibleScheme, CompositeRecipeScheme
 from models.models import *
+from pagination import PageParams, paginate, encode_cursor, decode_cursor
 from permissions import permission
 
 market_router = APIRouter()
@@ -18,12 +26,12 @@ market_router = APIRouter()
 
 @market_router.get("/get_products", response_model=List[ProductGetScheme])
 async def get_all_products(
-    session: AsyncSession = Depends(get_async_session)
+    response: Response,
+    page: PageParams = Depends(),
+    session: AsyncSession = Depends(get_async_read_session)
 ):
-    query = select(Product).options(selectinload(Product.category), selectinload(Product.unit)).order_by(Product.id)
-    result = await session.execute(query)
-    data = result.scalars().all()
-    return data
+    query = select(Product).options(selectinload(Product.category), selectinload(Product.unit))
+    return await paginate(session, query, [Product.id], page, response)
 
 
 @market_router.get('/product/{product_id}', response_model=ProductGetScheme)
@@ -61,7 +69,7 @@ async def add_product(
         session: AsyncSession = Depends(get_async_session)
 
 ):
-    if await permission(token['user_id'], session, ['admin', 'boss']):
+    if await permission(token['user_id'], session, ['admin', 'boss'], token.get('roles')):
         query1 = select(Category).where(Category.id == product_data.category)
         cat_data = await session.execute(query1)
         cat = cat_data.scalars().first()
@@ -126,130 +134,93 @@ async def add_category(
 async def create_oder(
         products: List[OrderScheme],
         costumer_id: int,
-        warehouse_id: int,
+        warehouse_id: Union[int, None] = None,
         paid: float = 0,
+        latitude: Union[float, None] = Query(None, ge=-90, le=90),
+        longitude: Union[float, None] = Query(None, ge=-180, le=180),
+        allocation: Literal['auto', 'greedy', 'exact'] = 'auto',
         token: dict = Depends(verify_token),
+        idempotency: IdempotencyKey = Depends(),
         session: AsyncSession = Depends(get_async_session)
 ):
-    product_list = []
-    total_price = 0
-    if paid >= 0:
-        for product in products:
-            query_pl = select(ProductLocation).where(ProductLocation.product_id == product.product_id and ProductLocation.warehouse_id == warehouse_id)
-            pl_data = await session.execute(query_pl)
-            product_location = pl_data.scalars().first()
-            if product_location and product_location.product_amount > product.quantity:
-                query_product = select(Product).where(Product.id == product.product_id)
-                product_data = await session.execute(query_product)
-                product__data = product_data.scalars().first()
-                product_list.append(product__data)
-                total_price += product__data.price*product.quantity
-            else:
-                raise HTTPException(status_code=400, detail="Product is not enough")
-        if product_list:
-            query = insert(OrderDetail).values(
-                user_id=token['user_id'],
-                costumer_id=costumer_id,
-                total_price=total_price,
-                paid=paid,
-                created_at=datetime.now()
-            )
-            await session.execute(query)
-            order_query = select(OrderDetail).where(
-                (OrderDetail.user_id == token['user_id']) &
-                (OrderDetail.costumer.has(id=costumer_id)))
-            order = await session.execute(order_query)
-            order_data = order.scalars().all()
-            for product in products:
-                query = insert(Order).values(
-                    product_id=product.product_id,
-                    count=product.quantity,
-                    order_detail_id=order_data[-1].id,
-                    warehouse_id=warehouse_id
-                )
-                await session.execute(query)
-            await session.commit()
-            return {'success': True, 'message': 'Order successfully created'}
-        else:
-            raise HTTPException(status_code=400, detail='No result found')
-    else:
+    # Under group commit the key is claimed by the order writer, in the transaction that writes the order.
+    replay = await idempotency.begin(session, 'create-oder', claim=not ORDER_GROUP_COMMIT)
+    if replay:
+        return replay
+    if paid < 0:
         raise HTTPException(status_code=400, detail='Invalid payment')
+    if not products:
+        raise HTTPException(status_code=400, detail='No result found')
+    demand = {}
+    for product in products:
+        demand[product.product_id] = demand.get(product.product_id, 0) + product.quantity
+    prices = await load_prices(session, demand)
+    if warehouse_id is None:
+        lines, distances = await allocate_order(session, demand, latitude, longitude, allocation)
+    else:
+        lines = [(product_id, warehouse_id, quantity) for product_id, quantity in demand.items()]
+        distances = {}
+    result = {
+        'success': True,
+        'message': 'Order successfully created',
+        'order_detail_id': None,
+        'total_price': None,
+        'reserved_until': None,
+        'allocation': [
+            {'product_id': product_id, 'warehouse_id': line_warehouse_id, 'count': count}
+            for product_id, line_warehouse_id, count in lines
+        ],
+        **shipment_summary(lines, distances)
+    }
+    if ORDER_GROUP_COMMIT:
+        # Hand the connection back while the order waits for its batch.
+        await session.rollback()
+        created = await order_writer.submit(
+            token['user_id'], costumer_id, lines, prices, paid, idempotency=idempotency, response=result
+        )
+        if isinstance(created, Response):
+            return created
+        order_detail_id, total_price, reserved_until = created
+        result.update(order_detail_id=order_detail_id, total_price=total_price, reserved_until=reserved_until)
+        return result
+    order_detail_id, total_price, reserved_until = await create_order(
+        session, token['user_id'], costumer_id, lines, prices, paid
+    )
+    result.update(order_detail_id=order_detail_id, total_price=total_price, reserved_until=reserved_until)
+    await idempotency.finish(session, result)
+    await session.commit()
+    return result
 
 
-@market_router.get('/client-orders/')
+@market_router.get('/client-orders/', response_model=List[ClientOrderScheme])
 async def client_order(
         costumer_id: int,
+        response: Response,
+        is_active: Union[bool, None] = None,
+        page: PageParams = Depends(),
         session: AsyncSession = Depends(get_async_session)
 ):
-    query_orders = select(OrderDetail).where(OrderDetail.costumer.has(id =costumer_id))
-    orders = await session.execute(query_orders)
-    order_details = orders.scalars().all()
-    order_list = []
-    if order_details is not None:
-        for order_detail in order_details:
-            query = select(Order).where(Order.order_detail_id == order_detail.id)
-            order_data = await session.execute(query)
-            orders = order_data.scalars().all()
-            product_list = []
-            for order in orders:
-                product_list.append({
-                    'product_id': order.product_id,
-                    'count': order.count
-                })
-            order_list.append({
-                'id': order_detail.id,
-                'paid': order_detail.paid,
-                'consumer_id': order_detail.user_id,
-                'total_price': order_detail.total_price,
-                'created_at': order_detail.created_at,
-                'is_active': order_detail.is_active,
-                'products': product_list
-            })
-    else:
-        raise HTTPException(status_code=400, detail='No result found')
-    return order_list
+    query = select(OrderDetail).options(
+        selectinload(OrderDetail.order).joinedload(Order.product).load_only(Product.name)
+    ).where(OrderDetail.costumer_id == costumer_id)
+    if is_active is not None:
+        query = query.where(OrderDetail.is_active == is_active)
+    return await paginate(session, query, [OrderDetail.created_at, OrderDetail.id], page, response, descending=True)
 
 
 @market_router.post('/confirm-order')
 async def confirm_order(
         order_detail_id: int,
+        idempotency: IdempotencyKey = Depends(),
         session: AsyncSession = Depends(get_async_session)
 ):
-    query = select(Order).options(
-        selectinload(Order.product),
-        selectinload(Order.warehouse),
-        selectinload(Order.order_detail)).where(Order.order_detail_id == order_detail_id)
-    order__data = await session.execute(query)
-    order_data = order__data.scalars().all()
-    if order_data:
-        data = await session.get(OrderDetail, order_detail_id)
-        if data.is_active:
-            for order in order_data:
-                query2 = select(ProductLocation).where(
-                    (ProductLocation.warehouse.has(id=order.warehouse_id)) &
-                    (ProductLocation.product_id == order.product_id)
-                )
-                data2 = await session.execute(query2)
-                data_loc = data2.scalars().first()
-                if data_loc:
-                    if data_loc.product_amount>=order.count:
-                        query1 = update(ProductLocation).where(
-                            ProductLocation.id == data_loc.id).values(
-                            product_amount=data_loc.product_amount-order.count
-                        )
-                        await session.execute(query1)
-                        order.order_detail.is_active = False
-                    else:
-                        raise HTTPException(status_code=400, detail=f'Product is not enough in {order.warehouse.name}')
-                else:
-                    raise HTTPException(status_code=400, detail=f'Product is None in {order.warehouse.name}')
-            await session.commit()
-        else:
-            raise HTTPException(status_code=400, detail='order already confirmed')
-
-        return {'message': 'Order confirmed.'}
-    else:
-        raise HTTPException(status_code=400, detail='Order not found')
+    replay = await idempotency.begin(session, 'confirm-order')
+    if replay:
+        return replay
+    await confirm_order_detail(session, order_detail_id)
+    result = await idempotency.finish(session, {'message': 'Order confirmed.'})
+    await session.commit()
+    return result
 
 
 @market_router.post('/start-composite')
@@ -258,25 +229,33 @@ async def start_composite(
         token: dict = Depends(verify_token),
         session: AsyncSession = Depends(get_async_session)
 ):
-    try:
-        query2 = select(User).options(selectinload(User.warehouse)).where(User.id == token['user_id'])
-        user_data = await session.execute(query2)
-        user = user_data.scalars().first()
-        query = insert(Composite).values(**data.dict(), employee_id=token['user_id'])
-        await session.execute(query)
-        query1 = select(ResourceLocation).where(
-            (ResourceLocation.warehouse_id == user.warehouse_id) and
-            (ResourceLocation.resource_id == data.resource_id))
-        data2 = await session.execute(query1)
-        re_loc = data2.scalars().first()
-        if re_loc.amount >= data.resource_amount:
-            await session.execute(update(ResourceLocation).where(
-                ResourceLocation.id == re_loc.id
-            ).values(amount=re_loc.amount-data.resource_amount))
-            await session.commit()
-            return {'success': True, **data.dict()}
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f'Resource location not in your address or not enough')
+    warehouse_id = await user_warehouse(session, token['user_id'])
+    composite_id = await start_production(
+        session, token['user_id'], warehouse_id, {data.resource_id: data.resource_amount}, **data.dict()
+    )
+    await session.commit()
+    return {'success': True, 'composite_id': composite_id, **data.dict()}
+
+
+@market_router.post('/start-recipe-composite')
+async def start_recipe_composite(
+        data: CompositeRecipeScheme,
+        token: dict = Depends(verify_token),
+        session: AsyncSession = Depends(get_async_session)
+):
+    warehouse_id = await user_warehouse(session, token['user_id'])
+    needs = await recipe_requirements(session, data.product_id, data.quantity)
+    composite_id = await start_production(
+        session, token['user_id'], warehouse_id, needs,
+        equipment_id=data.equipment_id, product_id=data.product_id, product_amount=data.quantity
+    )
+    await session.commit()
+    return {
+        'success': True,
+        'composite_id': composite_id,
+        **data.dict(),
+        'resources': [{'resource_id': resource_id, 'amount': amount} for resource_id, amount in needs.items()]
+    }
 
 
 @market_router.post('/end-composite')
@@ -297,17 +276,18 @@ async def end_composite(
 
 @market_router.get('/get-all-report', response_model=List[ReportGetScheme])
 async def get_all_report(
-        session: AsyncSession = Depends(get_async_session)
+        response: Response,
+        page: PageParams = Depends(),
+        session: AsyncSession = Depends(get_async_read_session)
 ):
     query = select(Composite).options(
         selectinload(Composite.employee),
         selectinload(Composite.product),
         selectinload(Composite.resource),
-        selectinload(Composite.equipment)
+        selectinload(Composite.equipment),
+        selectinload(Composite.resources)
     )
-    data = await session.execute(query)
-    reports = data.scalars().all()
-    return reports
+    return await paginate(session, query, [Composite.id], page, response)
 
 
 @market_router.get('/get-all-resource', response_model=List[ResourceGetScheme])
@@ -374,11 +354,12 @@ async def create_recipe(
 
 @market_router.get('/get-recipes')
 async def get_recipes(
+        response: Response,
+        page: PageParams = Depends(),
         session: AsyncSession = Depends(get_async_session)
 ):
-    query = select(Recipe).options(selectinload(Recipe.resource), selectinload(Recipe.product)).order_by(Recipe.product_id)
-    data = await session.execute(query)
-    return data.scalars().all()
+    query = select(Recipe).options(selectinload(Recipe.resource), selectinload(Recipe.product))
+    return await paginate(session, query, [Recipe.product_id, Recipe.id], page, response)
 
 
 @market_router.get('/get-product-recipe')
@@ -394,6 +375,26 @@ async def get_product_recipe(
     return {'product': product, 'recipe_data': resources}
 
 
+@market_router.get('/producible', response_model=List[ProducibleScheme])
+async def get_producible(
+        response: Response,
+        warehouse_id: Union[int, None] = None,
+        product_id: Union[int, None] = None,
+        producible_only: bool = False,
+        cursor: Union[str, None] = None,
+        limit: int = Query(PAGE_DEFAULT_LIMIT, gt=0, le=PAGE_MAX_LIMIT),
+        session: AsyncSession = Depends(get_async_session)
+):
+    # Built from the primary: a lagging replica read right after an invalidation would be cached until the TTL.
+    capacity = await get_production_capacity(session)
+    after = decode_cursor(cursor, [Warehouse.id, Product.id]) if cursor else None
+    rows = capacity.rows(warehouse_id, product_id, producible_only, after=after, limit=limit + 1)
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers['X-Next-Cursor'] = encode_cursor([rows[-1]['warehouse_id'], rows[-1]['product_id']])
+    return rows
+
+
 
 
 
@@ -0,0 +1,180 @@
+import time
+from datetime import datetime
+
+import numpy as np
+from fastapi import HTTPException
+from sqlalchemy import select, insert, update, func, values, column, Integer, Float
+
+from config import PRODUCTION_CACHE_TTL
+from database import on_table_write
+from models.models import Recipe, ResourceLocation, Warehouse, Composite, CompositeResource
+
+# Keeps e.g. 0.3 / 0.1 = 2.9999999999999996 from losing a whole unit to float rounding.
+ROUNDING_SLACK = 1e-9
+# Upper bound on warehouse x recipe-entry ratios held in memory at once.
+CHUNK_ELEMENTS = 4_000_000
+
+_capacity = None
+_capacity_generation = 0
+
+
+def producible_quantities(requirements, levels, chunk_elements: int = CHUNK_ELEMENTS):
+    """Return ``(quantities, limiting)`` for a ``(products, resources)`` requirement matrix and
+    ``(warehouses, resources)`` stock levels.
+
+    Both results are ``(warehouses, products)`` arrays: the whole units the stock covers and the column of the
+    resource that runs out first. Recipes use few of all resources, so only the matrix's non-zero entries are
+    divided; ``reduceat`` then takes the minimum over each product's run of entries. Every product row needs at
+    least one resource.
+    """
+    quantities = np.zeros((levels.shape[0], requirements.shape[0]), dtype=np.int64)
+    limiting = np.zeros((levels.shape[0], requirements.shape[0]), dtype=np.int64)
+    products, resources = np.nonzero(requirements > 0)
+    if not len(products):
+        return quantities, limiting
+    per_unit = requirements[products, resources]
+    starts = np.flatnonzero(np.r_[True, products[1:] != products[:-1]])
+    entries = np.arange(len(products))
+    step = max(1, chunk_elements // len(products))
+    for start in range(0, levels.shape[0], step):
+        ratios = np.maximum(levels[start:start + step, resources], 0) / per_unit
+        smallest = np.minimum.reduceat(ratios, starts, axis=1)
+        first_out = np.where(ratios == np.repeat(smallest, np.diff(np.r_[starts, len(products)]), axis=1), entries,
+                             len(products))
+        quantities[start:start + step, products[starts]] = np.floor(smallest + ROUNDING_SLACK)
+        limiting[start:start + step, products[starts]] = resources[np.minimum.reduceat(first_out, starts, axis=1)]
+    return quantities, limiting
+
+
+class ProductionCapacity:
+    """How many units of every product with a recipe each warehouse can make from its resource stock."""
+
+    def __init__(self, recipes, stock, warehouse_ids):
+        self.products = np.array(sorted({product_id for product_id, _, _ in recipes}), dtype=np.int64)
+        self.resources = np.array(sorted({resource_id for _, resource_id, _ in recipes}), dtype=np.int64)
+        self.warehouses = np.array(sorted(set(warehouse_ids)), dtype=np.int64)
+        product_row = {product_id: row for row, product_id in enumerate(self.products.tolist())}
+        resource_column = {resource_id: column for column, resource_id in enumerate(self.resources.tolist())}
+        warehouse_row = {warehouse_id: row for row, warehouse_id in enumerate(self.warehouses.tolist())}
+
+        requirements = np.zeros((len(self.products), len(self.resources)))
+        for product_id, resource_id, amount in recipes:
+            requirements[product_row[product_id], resource_column[resource_id]] += amount
+        levels = np.zeros((len(self.warehouses), len(self.resources)))
+        for warehouse_id, resource_id, amount in stock:
+            if warehouse_id in warehouse_row and resource_id in resource_column:
+                levels[warehouse_row[warehouse_id], resource_column[resource_id]] += amount or 0
+        self.quantities, self.limiting = producible_quantities(requirements, levels)
+
+    def rows(self, warehouse_id=None, product_id=None, producible_only: bool = False, after=None,
+             limit: int = None) -> list:
+        """Return ``{warehouse_id, product_id, quantity, limiting_resource_id}`` rows, by warehouse then product.
+
+        ``after`` is a ``(warehouse_id, product_id)`` pair to resume behind and ``limit`` caps the rows returned.
+        """
+        warehouse_rows = np.flatnonzero(self.warehouses == warehouse_id) if warehouse_id is not None \
+            else np.arange(len(self.warehouses))
+        product_columns = np.flatnonzero(self.products == product_id) if product_id is not None \
+            else np.arange(len(self.products))
+        if after is not None:
+            warehouse_rows = warehouse_rows[self.warehouses[warehouse_rows] >= after[0]]
+        quantities = self.quantities[np.ix_(warehouse_rows, product_columns)]
+        limiting = self.limiting[np.ix_(warehouse_rows, product_columns)]
+        selected = quantities > 0 if producible_only else np.ones(quantities.shape, dtype=bool)
+        if after is not None:
+            selected &= (self.warehouses[warehouse_rows][:, None] > after[0]) | \
+                (self.products[product_columns][None, :] > after[1])
+        row, column = np.nonzero(selected)
+        row, column = row[:limit], column[:limit]
+        return [
+            {'warehouse_id': warehouse, 'product_id': product, 'quantity': quantity, 'limiting_resource_id': resource}
+            for warehouse, product, quantity, resource in zip(
+                self.warehouses[warehouse_rows[row]].tolist(),
+                self.products[product_columns[column]].tolist(),
+                quantities[row, column].tolist(),
+                self.resources[limiting[row, column]].tolist()
+            )
+        ]
+
+
+def invalidate_production_capacity():
+    global _capacity, _capacity_generation
+    _capacity_generation += 1
+    _capacity = None
+
+
+on_table_write([Recipe, ResourceLocation, Warehouse], invalidate_production_capacity)
+
+
+async def get_production_capacity(session) -> ProductionCapacity:
+    """Return the cached capacity.
+
+    Local recipe and resource stock writes drop it at once; PRODUCTION_CACHE_TTL bounds how long writes made by other
+    workers or outside the API go unseen.
+    """
+    global _capacity
+    if _capacity is not None and _capacity[0] > time.monotonic():
+        return _capacity[1]
+    generation = _capacity_generation
+    recipes = (await session.execute(
+        select(Recipe.product_id, Recipe.resource_id, Recipe.amount).where(Recipe.amount > 0)
+    )).all()
+    stock = (await session.execute(
+        select(ResourceLocation.warehouse_id, ResourceLocation.resource_id, ResourceLocation.amount)
+    )).all()
+    warehouse_ids = (await session.execute(select(Warehouse.id))).scalars().all()
+    capacity = ProductionCapacity(recipes, stock, warehouse_ids)
+    if generation == _capacity_generation:
+        _capacity = (time.monotonic() + PRODUCTION_CACHE_TTL, capacity)
+    return capacity
+
+
+async def recipe_requirements(session, product_id: int, quantity: int) -> dict:
+    """Return the ``{resource_id: amount}`` needed for ``quantity`` units of ``product_id``."""
+    query = select(Recipe.resource_id, func.sum(Recipe.amount)).where(
+        (Recipe.product_id == product_id) & (Recipe.amount > 0)
+    ).group_by(Recipe.resource_id)
+    needs = {resource_id: round(amount * quantity, 9) for resource_id, amount in (await session.execute(query)).all()}
+    if not needs:
+        raise HTTPException(status_code=400, detail='Product has no recipe')
+    return needs
+
+
+async def consume_resources(session, warehouse_id: int, needs: dict):
+    """Deduct ``{resource_id: amount}`` from a warehouse's resource stock; the caller commits.
+
+    A warehouse holds one row per resource (``uq_resource_location_warehouse_resource``). The rows are locked in
+    resource order first, so concurrent starts that share resources queue instead of deadlocking. One
+    ``UPDATE ... FROM (VALUES ...)`` then decrements every row that still holds enough, and any resource missing
+    from its RETURNING rows is a shortage that fails the whole call.
+    """
+    locked = select(ResourceLocation.resource_id, ResourceLocation.amount).where(
+        (ResourceLocation.warehouse_id == warehouse_id) & ResourceLocation.resource_id.in_(list(needs))
+    ).order_by(ResourceLocation.resource_id).with_for_update()
+    on_hand = dict((await session.execute(locked)).all())
+    needed = values(column('resource_id', Integer), column('amount', Float), name='needed').data(list(needs.items()))
+    query = update(ResourceLocation).where(
+        (ResourceLocation.warehouse_id == warehouse_id) &
+        (ResourceLocation.resource_id == needed.c.resource_id) &
+        (ResourceLocation.amount >= needed.c.amount)
+    ).values(amount=ResourceLocation.amount - needed.c.amount).returning(ResourceLocation.resource_id)
+    consumed = set((await session.execute(query, execution_options={'synchronize_session': False})).scalars().all())
+    shortages = [
+        {'resource_id': resource_id, 'requested': amount, 'available': on_hand.get(resource_id, 0)}
+        for resource_id, amount in sorted(needs.items()) if resource_id not in consumed
+    ]
+    if shortages:
+        raise HTTPException(status_code=400, detail={'message': 'Resource is not enough', 'shortages': shortages})
+
+
+async def start_production(session, employee_id: int, warehouse_id: int, needs: dict, **composite) -> int:
+    """Consume ``needs`` and insert the composite with one consumption row per resource; the caller commits."""
+    await consume_resources(session, warehouse_id, needs)
+    composite_id = (await session.execute(insert(Composite).values(
+        employee_id=employee_id, start_at=datetime.utcnow(), **composite
+    ).returning(Composite.id))).scalar_one()
+    await session.execute(insert(CompositeResource).values([
+        {'composite_id': composite_id, 'resource_id': resource_id, 'warehouse_id': warehouse_id, 'amount': amount}
+        for resource_id, amount in needs.items()
+    ]))
+    return composite_id
@@ -1,7 +1,7 @@
 from datetime import datetime, date
 from typing import Union, List
 
-from pydantic import BaseModel, Field
+from pydantic import AliasPath, BaseModel, Field
 
 from accounts.scheme import UserInfoScheme
 
@@ -53,13 +53,19 @@ class ProductUpdateScheme(BaseModel):
 
 class OrderScheme(BaseModel):
     product_id: int
-    quantity: int = 1
+    quantity: int = Field(1, gt=0)
 
 
 class CompositeAddScheme(BaseModel):
     equipment_id: int
     resource_id: int
-    resource_amount: float
+    resource_amount: float = Field(gt=0)
+
+
+class CompositeRecipeScheme(BaseModel):
+    equipment_id: int
+    product_id: int
+    quantity: int = Field(gt=0)
 
 
 class EndProcessScheme(BaseModel):
@@ -104,13 +110,44 @@ class GetOrdersScheme(BaseModel):
     orders: List[OrderScheme]
 
 
+class ClientOrderLineScheme(BaseModel):
+    product_id: Union[int, None]
+    product_name: Union[str, None] = Field(None, validation_alias=AliasPath('product', 'name'))
+    warehouse_id: Union[int, None]
+    count: Union[int, None]
+
+
+class ClientOrderScheme(BaseModel):
+    id: int
+    consumer_id: Union[int, None] = Field(validation_alias='user_id')
+    paid: Union[float, None]
+    total_price: Union[float, None]
+    created_at: Union[datetime, None]
+    is_active: Union[bool, None]
+    products: List[ClientOrderLineScheme] = Field(validation_alias='order')
+
+
+class ProducibleScheme(BaseModel):
+    warehouse_id: int
+    product_id: int
+    quantity: int
+    limiting_resource_id: int
+
+
+class CompositeResourceScheme(BaseModel):
+    resource_id: int
+    warehouse_id: int
+    amount: float
+
+
 class ReportGetScheme(BaseModel):
     id: int
     product: Union[ProductScheme, None]
     product_amount: Union[int, None]
     employee: EmployeeScheme
-    resource: ResourceScheme
-    resource_amount: float
+    resource: Union[ResourceScheme, None]
+    resource_amount: Union[float, None]
+    resources: List[CompositeResourceScheme]
     start_at: datetime
     end_at: Union[datetime, None]
 
@@ -0,0 +1,67 @@
+import itertools
+import random
+from unittest import TestCase
+
+from fastapi import HTTPException
+
+from market.allocation import allocate, assign, exact_warehouses, greedy_warehouses
+
+
+def covers(demand, stock, warehouses):
+    return all(
+        sum(stock.get(product_id, {}).get(warehouse_id, 0) for warehouse_id in warehouses) >= quantity
+        for product_id, quantity in demand.items()
+    )
+
+
+class AllocationTest(TestCase):
+    def test_prefers_single_warehouse_that_covers_order(self):
+        demand = {1: 5, 2: 3}
+        stock = {1: {10: 5, 20: 5}, 2: {10: 1, 20: 3, 30: 3}}
+        rows = allocate(demand, stock, {10: 1.0, 20: 50.0, 30: 2.0})
+        self.assertEqual(rows, [(1, 20, 5), (2, 20, 3)])
+
+    def test_splits_line_across_warehouses_nearest_first(self):
+        demand = {1: 7}
+        stock = {1: {10: 4, 20: 4, 30: 4}}
+        rows = allocate(demand, stock, {10: 30.0, 20: 10.0, 30: 20.0}, mode='greedy')
+        self.assertEqual(sum(count for _, _, count in rows), 7)
+        self.assertEqual(len(rows), 2)
+
+    def test_exact_matches_brute_force_minimum(self):
+        rng = random.Random(3)
+        for _ in range(30):
+            warehouses = list(range(1, 9))
+            demand = {product_id: rng.randint(1, 6) for product_id in range(1, 5)}
+            stock = {
+                product_id: {warehouse_id: rng.randint(0, 4) for warehouse_id in rng.sample(warehouses, 4)}
+                for product_id in demand
+            }
+            distances = {warehouse_id: rng.uniform(0, 100) for warehouse_id in warehouses}
+            if not covers(demand, stock, warehouses):
+                continue
+            best = min(
+                (size, sum(distances[warehouse_id] for warehouse_id in combination))
+                for size in range(1, len(warehouses) + 1)
+                for combination in itertools.combinations(warehouses, size)
+                if covers(demand, stock, combination)
+            )
+            chosen = exact_warehouses(demand, stock, distances)
+            self.assertTrue(covers(demand, stock, chosen))
+            self.assertEqual(len(chosen), best[0])
+            self.assertAlmostEqual(sum(distances[warehouse_id] for warehouse_id in chosen), best[1])
+            greedy = greedy_warehouses(demand, stock, distances)
+            self.assertTrue(covers(demand, stock, greedy))
+            self.assertGreaterEqual(len(greedy), best[0])
+
+    def test_assign_fills_every_line(self):
+        demand = {1: 3, 2: 2}
+        stock = {1: {10: 2, 20: 2}, 2: {20: 2}}
+        rows = assign(demand, stock, [10, 20], {})
+        self.assertEqual(rows, [(1, 10, 2), (1, 20, 1), (2, 20, 2)])
+
+    def test_reports_shortages(self):
+        with self.assertRaises(HTTPException) as error:
+            allocate({1: 5, 2: 1}, {1: {10: 2, 20: 2}, 2: {10: 1}}, {})
+        self.assertEqual(error.exception.status_code, 400)
+        self.assertEqual(error.exception.detail['shortages'], {1: {'requested': 5, 'available': 4}})
@@ -0,0 +1,39 @@
+import asyncio
+from unittest import IsolatedAsyncioTestCase
+
+from fastapi import HTTPException
+
+from market.ingest import OrderWriter
+
+
+class OrderWriterBatchTest(IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.writer = OrderWriter(batch_size=3, max_wait=0.05)
+        self.writer.queue = asyncio.Queue()
+
+    def enqueue(self, count):
+        futures = [asyncio.get_running_loop().create_future() for _ in range(count)]
+        for position, future in enumerate(futures):
+            self.writer.queue.put_nowait(((1, 1, [(position, 1, 1)], {position: 1.0}, 0), None, future))
+        return futures
+
+    async def test_batch_closes_at_batch_size(self):
+        self.enqueue(5)
+        self.assertEqual(len(await self.writer.next_batch()), 3)
+        self.assertEqual(len(await self.writer.next_batch()), 2)
+
+    async def test_batch_closes_after_max_wait(self):
+        self.enqueue(1)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        self.assertEqual(len(await self.writer.next_batch()), 1)
+        self.assertGreaterEqual(loop.time() - start, 0.04)
+
+    async def test_stop_fails_queued_orders(self):
+        self.writer.task = asyncio.create_task(asyncio.sleep(60))
+        futures = self.enqueue(2)
+        await self.writer.stop()
+        for future in futures:
+            with self.assertRaises(HTTPException) as error:
+                future.result()
+            self.assertEqual(error.exception.status_code, 503)
@@ -0,0 +1,154 @@
+import asyncio
+import math
+import os
+import random
+from unittest import IsolatedAsyncioTestCase, TestCase, skipUnless
+
+from fastapi import HTTPException
+from sqlalchemy import func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from market.production import ProductionCapacity, recipe_requirements, start_production
+from models.models import metadata, Category, Unit, Product, Warehouse, User, Equipment, Resource, ResourceLocation, \
+    Recipe, Composite, CompositeResource
+
+TEST_DATABASE_URL = os.getenv('TEST_DATABASE_URL')
+CONCURRENCY = 20
+STARTS = 40
+
+
+class ProductionCapacityTest(TestCase):
+    def brute_force(self, recipes, stock, warehouse_id, product_id):
+        needed = {}
+        for recipe_product, resource_id, amount in recipes:
+            if recipe_product == product_id:
+                needed[resource_id] = needed.get(resource_id, 0) + amount
+        levels = {}
+        for stock_warehouse, resource_id, amount in stock:
+            if stock_warehouse == warehouse_id:
+                levels[resource_id] = levels.get(resource_id, 0) + amount
+        return min(math.floor(max(levels.get(resource_id, 0), 0) / amount + 1e-9) for resource_id, amount in needed.items())
+
+    def test_matches_brute_force(self):
+        rng = random.Random(3)
+        recipes = [
+            (product_id, resource_id, rng.choice([0.5, 1, 2, 3.5]))
+            for product_id in range(1, 41) for resource_id in rng.sample(range(1, 31), rng.randint(1, 5))
+        ]
+        stock = [(rng.randint(1, 25), rng.randint(1, 30), rng.uniform(0, 50)) for _ in range(400)]
+        capacity = ProductionCapacity(recipes, stock, range(1, 26))
+        rows = capacity.rows()
+        self.assertEqual(len(rows), 25 * 40)
+        for row in rows:
+            self.assertEqual(row['quantity'], self.brute_force(recipes, stock, row['warehouse_id'], row['product_id']))
+            used = [amount for product_id, resource_id, amount in recipes
+                    if product_id == row['product_id'] and resource_id == row['limiting_resource_id']]
+            self.assertTrue(used)
+
+    def test_limiting_resource_and_rounding(self):
+        capacity = ProductionCapacity(
+            [(1, 10, 0.1), (1, 20, 2), (2, 20, 1)],
+            [(5, 10, 0.3), (5, 20, 10), (6, 20, -4)],
+            [5, 6]
+        )
+        self.assertEqual(capacity.rows(), [
+            {'warehouse_id': 5, 'product_id': 1, 'quantity': 3, 'limiting_resource_id': 10},
+            {'warehouse_id': 5, 'product_id': 2, 'quantity': 10, 'limiting_resource_id': 20},
+            {'warehouse_id': 6, 'product_id': 1, 'quantity': 0, 'limiting_resource_id': 10},
+            {'warehouse_id': 6, 'product_id': 2, 'quantity': 0, 'limiting_resource_id': 20},
+        ])
+        self.assertEqual(capacity.rows(warehouse_id=5, product_id=2)[0]['quantity'], 10)
+        self.assertEqual(len(capacity.rows(producible_only=True)), 2)
+        self.assertEqual(capacity.rows(warehouse_id=7), [])
+
+    def test_pages_resume_after_the_cursor(self):
+        rng = random.Random(5)
+        recipes = [(product_id, rng.randint(1, 4), 1) for product_id in range(1, 8)]
+        stock = [(rng.randint(1, 6), rng.randint(1, 4), rng.randint(0, 3)) for _ in range(30)]
+        capacity = ProductionCapacity(recipes, stock, range(1, 7))
+        for producible_only in (False, True):
+            pages, after = [], None
+            while True:
+                page = capacity.rows(producible_only=producible_only, after=after, limit=4)
+                pages.extend(page)
+                if len(page) < 4:
+                    break
+                after = (page[-1]['warehouse_id'], page[-1]['product_id'])
+            self.assertEqual(pages, capacity.rows(producible_only=producible_only))
+
+    def test_no_recipes(self):
+        self.assertEqual(ProductionCapacity([], [(1, 1, 5)], [1, 2]).rows(), [])
+
+
+@skipUnless(TEST_DATABASE_URL, 'TEST_DATABASE_URL points at a scratch PostgreSQL database')
+class StartProductionTest(IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.engine = create_async_engine(TEST_DATABASE_URL, pool_size=CONCURRENCY, max_overflow=0)
+        self.session_maker = sessionmaker(self.engine, class_=AsyncSession, expire_on_commit=False)
+        async with self.engine.begin() as conn:
+            await conn.run_sync(metadata.drop_all)
+            await conn.run_sync(metadata.create_all)
+            await conn.execute(insert(Category).values(id=1, name='category'))
+            await conn.execute(insert(Unit).values(id=1, code='kg', name='kilogram'))
+            await conn.execute(insert(Warehouse).values(id=1, name='w1'))
+            await conn.execute(insert(User).values(id=1, login='employee', warehouse_id=1))
+            await conn.execute(insert(Equipment).values(id=1, name='press'))
+            await conn.execute(insert(Product), [
+                {'id': i, 'name': f'p{i}', 'category_id': 1, 'unit_id': 1, 'price': 1} for i in (1, 2)
+            ])
+            await conn.execute(insert(Resource), [{'id': i, 'name': f'r{i}', 'unit_id': 1} for i in (1, 2, 3)])
+            # Product 1 takes 2 of resource 1 and 1 of resource 2, so the stock covers 15 units.
+            await conn.execute(insert(Recipe), [
+                {'product_id': 1, 'resource_id': 1, 'amount': 2}, {'product_id': 1, 'resource_id': 2, 'amount': 1}
+            ])
+            await conn.execute(insert(ResourceLocation), [
+                {'warehouse_id': 1, 'resource_id': 1, 'amount': 40},
+                {'warehouse_id': 1, 'resource_id': 2, 'amount': 15},
+                {'warehouse_id': 1, 'resource_id': 3, 'amount': 5}
+            ])
+
+    async def asyncTearDown(self):
+        async with self.engine.begin() as conn:
+            await conn.run_sync(metadata.drop_all)
+        await self.engine.dispose()
+
+    async def state(self):
+        async with self.session_maker() as session:
+            stock = dict((await session.execute(select(ResourceLocation.resource_id, ResourceLocation.amount))).all())
+            composites = (await session.execute(select(func.count()).select_from(Composite))).scalar_one()
+            consumed = (await session.execute(select(func.count()).select_from(CompositeResource))).scalar_one()
+        return stock, composites, consumed
+
+    async def test_parallel_starts_consume_exactly_the_stock(self):
+        semaphore = asyncio.Semaphore(CONCURRENCY)
+
+        async def start():
+            async with semaphore, self.session_maker() as session:
+                try:
+                    needs = await recipe_requirements(session, 1, 1)
+                    await start_production(session, 1, 1, needs, equipment_id=1, product_id=1, product_amount=1)
+                    await session.commit()
+                    return True
+                except HTTPException:
+                    await session.rollback()
+                    return False
+
+        results = await asyncio.gather(*[start() for _ in range(STARTS)])
+        self.assertEqual(sum(results), 15)
+        self.assertEqual(await self.state(), ({1: 10, 2: 0, 3: 5}, 15, 30))
+
+    async def test_one_short_resource_rolls_back_the_others(self):
+        async with self.session_maker() as session:
+            with self.assertRaises(HTTPException) as error:
+                await start_production(session, 1, 1, {1: 4, 2: 100, 3: 1}, equipment_id=1)
+            await session.rollback()
+        self.assertEqual(error.exception.status_code, 400)
+        self.assertEqual(error.exception.detail['shortages'], [{'resource_id': 2, 'requested': 100, 'available': 15}])
+        self.assertEqual(await self.state(), ({1: 40, 2: 15, 3: 5}, 0, 0))
+
+    async def test_product_without_recipe(self):
+        async with self.session_maker() as session:
+            with self.assertRaises(HTTPException) as error:
+                await recipe_requirements(session, 2, 1)
+        self.assertEqual(error.exception.status_code, 400)
@@ -0,0 +1,130 @@
+from datetime import datetime
+
+from fastapi import HTTPException
+from sqlalchemy import select, insert, update, func
+
+from models.models import Product, Order, OrderDetail, User
+from warehouse.reservations import reserve_stock, confirm_reservations, line_totals, admit_orders, insert_reservations
+
+
+async def load_prices(session, product_ids) -> dict:
+    """Return ``{product_id: price}`` for all ``product_ids`` in one query; unknown ids are a 400."""
+    query = select(Product.id, Product.price).where(Product.id.in_(list(product_ids)))
+    prices = dict((await session.execute(query)).all())
+    missing = sorted(set(product_ids) - set(prices))
+    if missing:
+        raise HTTPException(status_code=400, detail={'message': 'Product not found', 'product_ids': missing})
+    return prices
+
+
+async def create_order(session, user_id: int, costumer_id: int, lines, prices: dict, paid: float = 0):
+    """Insert an order header and its ``(product_id, warehouse_id, count)`` lines and reserve their stock.
+
+    The header id comes back from ``INSERT ... RETURNING`` and the lines go in as one multi-row insert, so the
+    cost does not depend on how many orders the customer already has. The caller commits.
+    """
+    total_price = sum(prices[product_id] * count for product_id, _, count in lines)
+    order_detail_id = (await session.execute(insert(OrderDetail).values(
+        user_id=user_id,
+        costumer_id=costumer_id,
+        total_price=total_price,
+        paid=paid,
+        created_at=datetime.now()
+    ).returning(OrderDetail.id))).scalar_one()
+    await session.execute(insert(Order).values([
+        {'product_id': product_id, 'warehouse_id': warehouse_id, 'count': count, 'order_detail_id': order_detail_id}
+        for product_id, warehouse_id, count in lines
+    ]))
+    reserved_until = await reserve_stock(session, order_detail_id, lines)
+    return order_detail_id, total_price, reserved_until
+
+
+async def create_orders(session, orders, idempotency=None) -> list:
+    """Insert a batch of ``(user_id, costumer_id, lines, prices, paid)`` orders with one statement per table.
+
+    Orders are admitted against stock in the order given; the result for each is ``(order_detail_id, total_price,
+    reserved_until)`` or the ``HTTPException`` that rejected it. The caller commits.
+
+    ``idempotency`` optionally pairs each order with an ``(IdempotencyKey, response)`` whose key is claimed in this
+    transaction: an already used key makes its stored response the order's result, and a written order records
+    ``response`` with its ids filled in, so the order and its key commit together.
+    """
+    idempotency = idempotency or [None] * len(orders)
+    results = [None] * len(orders)
+    for position, keyed in enumerate(idempotency):
+        if keyed is not None:
+            try:
+                results[position] = await keyed[0].claim(session)
+            except HTTPException as error:
+                results[position] = error
+    pending = [position for position, result in enumerate(results) if result is None]
+    if not pending:
+        return results
+    batch = {position: line_totals(orders[position][2]) for position in pending}
+    for position, error in zip(pending, await admit_orders(session, list(batch.values()))):
+        results[position] = error
+        if error is not None and idempotency[position] is not None:
+            await idempotency[position][0].release(session)
+    positions = [position for position in pending if results[position] is None]
+    if not positions:
+        return results
+    created_at = datetime.now()
+    headers = []
+    for position in positions:
+        user_id, costumer_id, lines, prices, paid = orders[position]
+        headers.append({
+            'user_id': user_id,
+            'costumer_id': costumer_id,
+            'total_price': sum(prices[product_id] * count for product_id, _, count in lines),
+            'paid': paid,
+            'created_at': created_at
+        })
+    query = insert(OrderDetail).returning(OrderDetail.id, sort_by_parameter_order=True)
+    ids = (await session.execute(query, headers)).scalars().all()
+    await session.execute(insert(Order).values([
+        {'product_id': product_id, 'warehouse_id': warehouse_id, 'count': count, 'order_detail_id': order_detail_id}
+        for position, order_detail_id in zip(positions, ids)
+        for product_id, warehouse_id, count in orders[position][2]
+    ]))
+    reserved_until = await insert_reservations(session, [
+        (order_detail_id, batch[position]) for position, order_detail_id in zip(positions, ids)
+    ])
+    for position, order_detail_id, header in zip(positions, ids, headers):
+        results[position] = (order_detail_id, header['total_price'], reserved_until)
+        if idempotency[position] is not None:
+            key, response = idempotency[position]
+            await key.finish(session, {
+                **response, 'order_detail_id': order_detail_id, 'total_price': header['total_price'],
+                'reserved_until': reserved_until
+            })
+    return results
+
+
+async def confirm_order_detail(session, order_detail_id: int):
+    """Deactivate an order and deduct its lines from stock; the caller commits.
+
+    Flipping ``is_active`` with a conditional UPDATE comes first, so a second confirm of the same order waits for
+    the row lock and then finds nothing to do.
+    """
+    confirmed = await session.execute(update(OrderDetail).where(
+        (OrderDetail.id == order_detail_id) & OrderDetail.is_active
+    ).values(is_active=False).returning(OrderDetail.id), execution_options={'synchronize_session': False})
+    if confirmed.scalar_one_or_none() is None:
+        if await session.get(OrderDetail, order_detail_id) is None:
+            raise HTTPException(status_code=400, detail='Order not found')
+        raise HTTPException(status_code=400, detail='order already confirmed')
+    query = select(Order.product_id, Order.warehouse_id, func.sum(Order.count)).where(
+        Order.order_detail_id == order_detail_id
+    ).group_by(Order.product_id, Order.warehouse_id)
+    lines = (await session.execute(query)).tuples().all()
+    if not lines:
+        raise HTTPException(status_code=400, detail='Order not found')
+    await confirm_reservations(session, order_detail_id, lines)
+
+
+async def user_warehouse(session, user_id: int) -> int:
+    """Return the warehouse an employee works in; employees without one are a 400."""
+    warehouse_id = (await session.execute(select(User.warehouse_id).where(User.id == user_id))).scalar_one_or_none()
+    if warehouse_id is None:
+        raise HTTPException(status_code=400, detail='User is not assigned to a warehouse')
+    return warehouse_id
@@ -0,0 +1,59 @@
+"""performance indexes
+
+Revision ID: 5bedc047ce6b
+Revises: 030bacb73967
+Create Date: 2026-10-18 10:12:41.207305
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5bedc047ce6b'
+down_revision: Union[str, None] = '030bacb73967'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = [
+    ('uq_product_location_product_warehouse', 'product_location', ['product_id', 'warehouse_id'], True),
+    ('ix_product_location_warehouse_product', 'product_location', ['warehouse_id', 'product_id'], False),
+    ('ix_order_order_detail_id', 'order', ['order_detail_id'], False),
+    ('ix_order_detail_costumer_created_at', 'order_detail', ['costumer', 'created_at', 'id'], False),
+    ('ix_resource_location_warehouse_resource', 'resource_location', ['warehouse_id', 'resource_id'], False),
+    ('ix_recipe_product_id', 'recipe', ['product_id'], False),
+    ('ix_product_category', 'product', ['category'], False),
+    ('ix_product_history_last_update', 'product_history', ['last_update'], False),
+]
+
+
+def upgrade() -> None:
+    # Fold duplicate (product, warehouse) rows into the oldest one so the unique index can be built.
+    op.execute("""
+        UPDATE product_location AS pl SET product_amount = dup.total
+        FROM (
+            SELECT min(id) AS keep_id, sum(product_amount) AS total
+            FROM product_location
+            GROUP BY product_id, warehouse_id
+            HAVING count(*) > 1
+        ) AS dup
+        WHERE pl.id = dup.keep_id
+    """)
+    op.execute("""
+        DELETE FROM product_location AS pl
+        USING product_location AS other
+        WHERE pl.product_id = other.product_id
+          AND pl.warehouse_id = other.warehouse_id
+          AND pl.id > other.id
+    """)
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block.
+    with op.get_context().autocommit_block():
+        for name, table, columns, unique in INDEXES:
+            op.create_index(name, table, columns, unique=unique, postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, columns, unique in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,96 @@
+"""partition product history by month
+
+Revision ID: 7c41d2a9e8f3
+Revises: 5bedc047ce6b
+Create Date: 2026-10-18 14:02:17.518830
+
+"""
+from datetime import datetime
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c41d2a9e8f3'
+down_revision: Union[str, None] = '5bedc047ce6b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+MONTHS_AHEAD = 3
+
+
+def add_months(month: datetime, count: int) -> datetime:
+    index = month.year * 12 + month.month - 1 + count
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def upgrade() -> None:
+    op.execute('ALTER TABLE product_history RENAME TO product_history_legacy')
+    op.execute('ALTER INDEX product_history_pkey RENAME TO product_history_legacy_pkey')
+    op.execute('DROP INDEX IF EXISTS ix_product_history_last_update')
+    # Rows written before last_update had a default fall into the month of the oldest known update.
+    op.execute("""
+        UPDATE product_history_legacy SET last_update = coalesce(
+            (SELECT min(last_update) FROM product_history_legacy), now() AT TIME ZONE 'utc'
+        ) WHERE last_update IS NULL
+    """)
+    # The partition key has to be part of every unique constraint on a partitioned table.
+    op.execute("""
+        CREATE TABLE product_history (
+            id integer NOT NULL DEFAULT nextval('product_history_id_seq'),
+            product_id integer REFERENCES product (id),
+            warehouse_old_id integer REFERENCES warehouse (id),
+            warehouse_new_id integer REFERENCES warehouse (id),
+            last_update timestamp without time zone NOT NULL DEFAULT (now() AT TIME ZONE 'utc'),
+            amount integer,
+            PRIMARY KEY (id, last_update)
+        ) PARTITION BY RANGE (last_update)
+    """)
+    op.execute('ALTER SEQUENCE product_history_id_seq OWNED BY product_history.id')
+    op.create_index('ix_product_history_last_update_id', 'product_history', ['last_update', 'id'])
+
+    first = op.get_bind().execute(sa.text(
+        "SELECT date_trunc('month', min(last_update)) FROM product_history_legacy"
+    )).scalar()
+    now = datetime.utcnow()
+    month = first or datetime(now.year, now.month, 1)
+    last = add_months(datetime(now.year, now.month, 1), MONTHS_AHEAD)
+    while month <= last:
+        following = add_months(month, 1)
+        op.execute(
+            f"CREATE TABLE product_history_y{month:%Y}m{month:%m} PARTITION OF product_history "
+            f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{following:%Y-%m-%d}')"
+        )
+        month = following
+
+    op.execute("""
+        INSERT INTO product_history (id, product_id, warehouse_old_id, warehouse_new_id, last_update, amount)
+        SELECT id, product_id, warehouse_old_id, warehouse_new_id, last_update, amount FROM product_history_legacy
+    """)
+    op.execute('DROP TABLE product_history_legacy')
+
+
+def downgrade() -> None:
+    op.execute('ALTER TABLE product_history RENAME TO product_history_partitioned')
+    op.execute('ALTER INDEX product_history_pkey RENAME TO product_history_partitioned_pkey')
+    op.execute('ALTER INDEX ix_product_history_last_update_id RENAME TO ix_product_history_partitioned_last_update_id')
+    op.execute("""
+        CREATE TABLE product_history (
+            id integer NOT NULL DEFAULT nextval('product_history_id_seq') PRIMARY KEY,
+            product_id integer REFERENCES product (id),
+            warehouse_old_id integer REFERENCES warehouse (id),
+            warehouse_new_id integer REFERENCES warehouse (id),
+            last_update timestamp without time zone,
+            amount integer
+        )
+    """)
+    op.execute("""
+        INSERT INTO product_history (id, product_id, warehouse_old_id, warehouse_new_id, last_update, amount)
+        SELECT id, product_id, warehouse_old_id, warehouse_new_id, last_update, amount FROM product_history_partitioned
+    """)
+    op.execute('ALTER SEQUENCE product_history_id_seq OWNED BY product_history.id')
+    op.create_index('ix_product_history_last_update', 'product_history', ['last_update'])
+    # Dropping the parent drops every partition still attached to it.
+    op.execute('DROP TABLE product_history_partitioned')
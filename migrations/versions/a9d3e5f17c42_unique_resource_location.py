@@ -0,0 +1,50 @@
+"""unique resource location
+
+Revision ID: a9d3e5f17c42
+Revises: f1c3a8d52b70
+Create Date: 2026-10-19 11:02:37.518264
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a9d3e5f17c42'
+down_revision: Union[str, None] = 'f1c3a8d52b70'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # The table is small, so the index is built in the same transaction as the clean-up, with writers held off,
+    # instead of CONCURRENTLY: a duplicate slipping in between would leave an INVALID index that enforces nothing.
+    op.execute('LOCK TABLE resource_location IN SHARE ROW EXCLUSIVE MODE')
+    # Fold duplicate (warehouse, resource) rows into the oldest one so the unique index can be built.
+    op.execute("""
+        UPDATE resource_location AS rl SET amount = dup.total
+        FROM (
+            SELECT min(id) AS keep_id, sum(amount) AS total
+            FROM resource_location
+            GROUP BY warehouse_id, resource_id
+            HAVING count(*) > 1
+        ) AS dup
+        WHERE rl.id = dup.keep_id
+    """)
+    op.execute("""
+        DELETE FROM resource_location AS rl
+        USING resource_location AS other
+        WHERE rl.warehouse_id = other.warehouse_id
+          AND rl.resource_id = other.resource_id
+          AND rl.id > other.id
+    """)
+    op.drop_index('uq_resource_location_warehouse_resource', table_name='resource_location', if_exists=True)
+    op.create_index('uq_resource_location_warehouse_resource', 'resource_location', ['warehouse_id', 'resource_id'],
+                    unique=True)
+    op.drop_index('ix_resource_location_warehouse_resource', table_name='resource_location', if_exists=True)
+
+
+def downgrade() -> None:
+    op.create_index('ix_resource_location_warehouse_resource', 'resource_location', ['warehouse_id', 'resource_id'])
+    op.drop_index('uq_resource_location_warehouse_resource', table_name='resource_location')
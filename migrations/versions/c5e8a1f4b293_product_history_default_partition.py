@@ -0,0 +1,45 @@
+"""product history default partition
+
+Revision ID: c5e8a1f4b293
+Revises: a9d3e5f17c42
+Create Date: 2026-10-19 12:21:05.884310
+
+"""
+from datetime import datetime
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5e8a1f4b293'
+down_revision: Union[str, None] = 'a9d3e5f17c42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def add_months(month: datetime, count: int) -> datetime:
+    index = month.year * 12 + month.month - 1 + count
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def upgrade() -> None:
+    # Catches rows for months nobody created a partition for yet, instead of failing every history insert.
+    op.execute('CREATE TABLE product_history_default PARTITION OF product_history DEFAULT')
+
+
+def downgrade() -> None:
+    # Give the default's rows monthly partitions of their own before it goes.
+    op.execute('ALTER TABLE product_history DETACH PARTITION product_history_default')
+    months = op.get_bind().execute(sa.text(
+        "SELECT DISTINCT date_trunc('month', last_update) FROM product_history_default ORDER BY 1"
+    )).scalars().all()
+    for month in months:
+        following = add_months(month, 1)
+        op.execute(
+            f"CREATE TABLE IF NOT EXISTS product_history_y{month:%Y}m{month:%m} PARTITION OF product_history "
+            f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{following:%Y-%m-%d}')"
+        )
+    op.execute('INSERT INTO product_history SELECT * FROM product_history_default')
+    op.execute('DROP TABLE product_history_default')
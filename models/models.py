@@ -2,7 +2,7 @@
 from sqlalchemy import (
     Column, ForeignKey, Integer, String,
     Text, TIMESTAMP, DECIMAL, UniqueConstraint,
-    MetaData, Boolean, Float, Date, event, Enum
+    MetaData, Boolean, Float, Date, event, Enum, Index, JSON
 )
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
@@ -18,7 +18,7 @@ class Product(Base):
     id = Column(Integer, primary_key=True, autoincrement=True)
     name = Column('name', String)
     description = Column('description', String)
-    category_id = Column('category', Integer, ForeignKey('category.id'))
+    category_id = Column('category', Integer, ForeignKey('category.id'), index=True)
     unit_id = Column('unit', Integer, ForeignKey('unit.id'))
     price = Column('price', Float)
     last_updated = Column('last_updated', TIMESTAMP(), default=datetime.utcnow())
@@ -117,6 +117,10 @@ class OrderDetail(Base):
     created_at = Column('created_at', TIMESTAMP(), default=datetime.utcnow())
     is_active = Column('is_active', Boolean, default=True)
 
+    __table_args__ = (
+        Index('ix_order_detail_costumer_created_at', costumer_id, created_at, id),
+    )
+
     costumer = relationship('Costumer', foreign_keys=[costumer_id], back_populates='order_detail')
     user = relationship('User', back_populates='order_detail')
     order = relationship('Order', back_populates='order_detail')
@@ -128,7 +132,7 @@ class Order(Base):
     metadata = metadata
     product_id = Column('product_id', Integer, ForeignKey('product.id'))
     warehouse_id = Column('warehouse_id', Integer, ForeignKey('warehouse.id'))
-    order_detail_id = Column('order_detail_id', Integer, ForeignKey('order_detail.id'))
+    order_detail_id = Column('order_detail_id', Integer, ForeignKey('order_detail.id'), index=True)
     count = Column('count', Integer)
 
     order_detail = relationship('OrderDetail', back_populates='order')
@@ -152,15 +156,20 @@ class Costumer(Base):
 
 
 class ProductHistory(Base):
+    # Range-partitioned by last_update month in the database, see warehouse/partitions.py.
     __tablename__ = 'product_history'
     metadata = metadata
     id = Column('id', Integer, primary_key=True, autoincrement=True)
     product_id = Column('product_id', Integer, ForeignKey('product.id'))
     warehouse_old_id = Column('warehouse_old_id', Integer, ForeignKey('warehouse.id'))
     warehouse_new_id = Column('warehouse_new_id', Integer, ForeignKey('warehouse.id'))
-    last_update = Column('last_update', TIMESTAMP, default=datetime.utcnow())
+    last_update = Column('last_update', TIMESTAMP, default=datetime.utcnow, nullable=False)
     amount = Column('amount', Integer)
 
+    __table_args__ = (
+        Index('ix_product_history_last_update_id', last_update, id),
+    )
+
     product = relationship('Product', back_populates='history')
 
 
@@ -198,10 +207,44 @@ class ProductLocation(Base):
     warehouse_id = Column('warehouse_id', Integer, ForeignKey('warehouse.id'))
     product_amount = Column('product_amount', Integer)
 
+    __table_args__ = (
+        Index('uq_product_location_product_warehouse', product_id, warehouse_id, unique=True),
+        Index('ix_product_location_warehouse_product', warehouse_id, product_id),
+    )
+
     product = relationship('Product', back_populates='product_location')
     warehouse = relationship('Warehouse', back_populates='product_location')
 
 
+class StockReservation(Base):
+    __tablename__ = 'stock_reservation'
+    metadata = metadata
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    order_detail_id = Column(Integer, ForeignKey('order_detail.id', ondelete='CASCADE'), index=True)
+    product_id = Column(Integer, ForeignKey('product.id'))
+    warehouse_id = Column(Integer, ForeignKey('warehouse.id'))
+    amount = Column(Integer, nullable=False)
+    expires_at = Column(TIMESTAMP, nullable=False, index=True)
+
+    __table_args__ = (
+        Index('ix_stock_reservation_product_warehouse_expires', product_id, warehouse_id, expires_at,
+              postgresql_include=['amount']),
+    )
+
+
+class IdempotencyRecord(Base):
+    __tablename__ = 'idempotency_key'
+    metadata = metadata
+    endpoint = Column(String(64), primary_key=True)
+    # The caller's user id, 0 for anonymous requests; keys are only unique per caller.
+    user_id = Column(Integer, primary_key=True, autoincrement=False, server_default='0')
+    key = Column(String(255), primary_key=True)
+    request_hash = Column(String(64), nullable=False)
+    status_code = Column(Integer)
+    response = Column(JSON)
+    expires_at = Column(TIMESTAMP, nullable=False, index=True)
+
+
 class Equipment(Base):
     __tablename__ = 'equipment'
     metadata = metadata
@@ -229,6 +272,20 @@ class Composite(Base):
     equipment = relationship('Equipment', back_populates='composite')
     employee = relationship('User', back_populates='composite')
     resource = relationship('Resource', back_populates='composite')
+    resources = relationship('CompositeResource', back_populates='composite')
+
+
+class CompositeResource(Base):
+    __tablename__ = 'composite_resource'
+    metadata = metadata
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    composite_id = Column(Integer, ForeignKey('composite.id', ondelete='CASCADE'), index=True)
+    resource_id = Column(Integer, ForeignKey('resource.id'))
+    warehouse_id = Column(Integer, ForeignKey('warehouse.id'))
+    amount = Column(Float, nullable=False)
+
+    composite = relationship('Composite', back_populates='resources')
+    resource = relationship('Resource')
 
 
 class Resource(Base):
@@ -253,6 +310,10 @@ class ResourceLocation(Base):
     warehouse_id = Column(Integer, ForeignKey('warehouse.id'))
     amount = Column(Float)
 
+    __table_args__ = (
+        Index('uq_resource_location_warehouse_resource', warehouse_id, resource_id, unique=True),
+    )
+
     warehouse = relationship('Warehouse', back_populates='resource_location')
     resource = relationship('Resource', back_populates='resource_location')
 
@@ -261,7 +322,7 @@ class Recipe(Base):
     __tablename__ = 'recipe'
     metadata = metadata
     id = Column(Integer, primary_key=True, autoincrement=True)
-    product_id = Column(Integer, ForeignKey('product.id'))
+    product_id = Column(Integer, ForeignKey('product.id'), index=True)
     resource_id = Column(Integer, ForeignKey('resource.id'))
     amount = Column(Float)
 
@@ -0,0 +1,110 @@
+import base64
+import json
+from datetime import datetime
+from typing import Union
+
+from fastapi import HTTPException, Query, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import inspect, tuple_, and_, or_, false
+
+from config import PAGE_DEFAULT_LIMIT, PAGE_MAX_LIMIT
+
+
+class PageParams:
+    def __init__(
+            self,
+            cursor: Union[str, None] = None,
+            limit: int = Query(PAGE_DEFAULT_LIMIT, gt=0, le=PAGE_MAX_LIMIT),
+            fields: Union[str, None] = Query(None, description='Comma separated column names to return')
+    ):
+        self.cursor = cursor
+        self.limit = limit
+        self.fields = fields
+
+
+def encode_cursor(values) -> str:
+    raw = json.dumps(jsonable_encoder(list(values))).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str, order_by) -> list:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if not isinstance(values, list) or len(values) != len(order_by):
+            raise ValueError(cursor)
+        return [
+            None if value is None else
+            datetime.fromisoformat(value) if column.type.python_type is datetime else
+            column.type.python_type(value)
+            for column, value in zip(order_by, values)
+        ]
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail='Invalid cursor')
+
+
+def projection_columns(model, fields: str, order_by, hidden=()):
+    columns = {attr.key: getattr(model, attr.key) for attr in inspect(model).column_attrs if attr.key not in hidden}
+    selected = []
+    for name in [field.strip() for field in fields.split(',') if field.strip()]:
+        if name not in columns:
+            raise HTTPException(status_code=400, detail=f'Unknown field: {name}')
+        selected.append(columns[name])
+    for column in order_by:
+        if column.key not in [item.key for item in selected]:
+            selected.append(column)
+    return selected
+
+
+def keyset_after(order_by: list, values: list, descending=False):
+    """Return the condition for rows that follow ``values`` in ``order_by`` order.
+
+    NULLs compare greater than every value, as in PostgreSQL's default ordering (last ascending, first descending),
+    so index scans still serve the sort. A plain row comparison is used when no key can be NULL; otherwise it is
+    spelled out column by column, because ``(a, b) > (x, y)`` is never true when ``a`` or ``x`` is NULL.
+    """
+    if not any(column.expression.nullable for column in order_by) and None not in values:
+        key, cursor = tuple_(*order_by), tuple_(*values)
+        return key < cursor if descending else key > cursor
+    branches = []
+    for position, (column, value) in enumerate(zip(order_by, values)):
+        if value is None:
+            after = column.is_not(None) if descending else false()
+        elif descending:
+            after = column < value
+        else:
+            after = or_(column > value, column.is_(None)) if column.expression.nullable else column > value
+        equal = [
+            previous.is_(None) if previous_value is None else previous == previous_value
+            for previous, previous_value in zip(order_by[:position], values[:position])
+        ]
+        branches.append(and_(*equal, after))
+    return or_(*branches)
+
+
+async def paginate(session, query, order_by: list, page: PageParams, response: Response, hidden=(), descending=False):
+    """Return one page of ``query`` ordered by ``order_by``, whose last column must be unique.
+
+    The cursor for the following page is sent in the ``X-Next-Cursor`` header.  When ``page.fields`` is set only
+    those columns are selected and the rows are returned as a JSON response that bypasses the response model.
+    """
+    projected = bool(page.fields)
+    if projected:
+        model = query.column_descriptions[0]['entity']
+        query = query.with_only_columns(*projection_columns(model, page.fields, order_by, hidden))
+    if page.cursor:
+        query = query.where(keyset_after(order_by, decode_cursor(page.cursor, order_by), descending))
+    query = query.order_by(None).order_by(*[column.desc() if descending else column for column in order_by])
+    result = await session.execute(query.limit(page.limit + 1))
+    items = result.mappings().all() if projected else result.scalars().all()
+
+    next_cursor = None
+    if len(items) > page.limit:
+        items = items[:page.limit]
+        last = items[-1]
+        next_cursor = encode_cursor(last[column.key] if projected else getattr(last, column.key) for column in order_by)
+    if projected:
+        response = JSONResponse(jsonable_encoder([dict(item) for item in items]))
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response if projected else items
@@ -1,16 +1,39 @@
+import time
+
 from sqlalchemy import select
 
+from config import ROLE_CACHE_TTL
+from database import on_table_write
 from models.models import UserRoles, Role
 
+_role_cache = {}
+_role_cache_generation = 0
+
+
+def invalidate_roles():
+    global _role_cache_generation
+    _role_cache_generation += 1
+    _role_cache.clear()
+
+
+on_table_write([UserRoles, Role], invalidate_roles)
+
+
+async def get_user_roles(user_id, session, use_cache: bool = True) -> frozenset:
+    cached = _role_cache.get(user_id)
+    if use_cache and cached and cached[0] > time.monotonic():
+        return cached[1]
+    generation = _role_cache_generation
+    query = select(Role.name).join(UserRoles, UserRoles.role_id == Role.id).where(UserRoles.user_id == user_id)
+    result = await session.execute(query)
+    roles = frozenset(result.scalars().all())
+    if generation == _role_cache_generation:
+        _role_cache[user_id] = (time.monotonic() + ROLE_CACHE_TTL, roles)
+    return roles
+
 
-async def permission(user_id, session, role_names: list):
-    query = select(UserRoles).where(UserRoles.user_id == user_id)
-    user_roles = await session.execute(query)
-    user_role_data = user_roles.scalars().all()
-    for user_role in user_role_data:
-        query_role = select(Role).where(Role.id == user_role.role_id)
-        role_data = await session.execute(query_role)
-        role = role_data.scalars().one()
-        if role.name in role_names:
-            return True
-    return False
+async def permission(user_id, session, role_names: list, token_roles: list = None):
+    if token_roles is not None:
+        return not set(token_roles).isdisjoint(role_names)
+    roles = await get_user_roles(user_id, session)
+    return not roles.isdisjoint(role_names)
@@ -0,0 +1,69 @@
+"""Assert that the hot inventory and order queries are served by index scans.
+
+Run from the project root against a migrated database:
+
+    python -m scripts.check_query_plans
+
+Sequential scans are disabled for the session so the check verifies that a
+usable index exists even on small development tables, where the planner
+would otherwise prefer a sequential scan.
+"""
+import json
+import sys
+
+from sqlalchemy import create_engine, select, text, func
+
+from config import POSTGRES_DB, POSTGRES_USER, POSTGRES_PASSWORD, POSTGRES_HOST, POSTGRES_PORT
+from models.models import ProductLocation, Order, OrderDetail, ResourceLocation, Recipe, Product, ProductHistory, \
+    StockReservation
+
+SCAN_NODES = {'Index Scan', 'Index Only Scan', 'Bitmap Index Scan'}
+
+HOT_QUERIES = {
+    'stock by product and warehouse': select(ProductLocation).where(
+        ProductLocation.product_id == 1, ProductLocation.warehouse_id == 1),
+    'stock by warehouse': select(ProductLocation).where(ProductLocation.warehouse_id == 1),
+    'order lines by order': select(Order).where(Order.order_detail_id == 1),
+    'orders by customer': select(OrderDetail).where(OrderDetail.costumer_id == 1).order_by(
+        OrderDetail.created_at, OrderDetail.id),
+    'resource by warehouse': select(ResourceLocation).where(
+        ResourceLocation.warehouse_id == 1, ResourceLocation.resource_id == 1),
+    'recipe by product': select(Recipe).where(Recipe.product_id == 1),
+    'products by category': select(Product).where(Product.category_id == 1),
+    'history by time': select(ProductHistory).where(ProductHistory.last_update >= '2024-01-01'),
+    'active reservations by stock': select(func.sum(StockReservation.amount)).where(
+        StockReservation.product_id == 1, StockReservation.warehouse_id == 1,
+        StockReservation.expires_at > '2024-01-01'),
+}
+
+
+def plan_nodes(plan):
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from plan_nodes(child)
+
+
+def main():
+    engine = create_engine(
+        f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}")
+    failures = []
+    with engine.connect() as conn:
+        conn.execute(text('SET enable_seqscan = off'))
+        for name, query in HOT_QUERIES.items():
+            sql = str(query.compile(engine, compile_kwargs={'literal_binds': True}))
+            plan = conn.execute(text(f'EXPLAIN (FORMAT JSON) {sql}')).scalar()
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            nodes = list(plan_nodes(plan[0]['Plan']))
+            indexes = [node['Index Name'] for node in nodes if node['Node Type'] in SCAN_NODES]
+            if indexes:
+                print(f'ok    {name}: {", ".join(indexes)}')
+            else:
+                failures.append(name)
+                print(f'FAIL  {name}: {", ".join(node["Node Type"] for node in nodes)}')
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+"""Keep the monthly product_history partitions rolling.
+
+Run from the project root, e.g. daily from cron:
+
+    python -m scripts.maintain_history_partitions [--archive-dir DIR]
+
+Creates the partitions for the coming months (HISTORY_PARTITIONS_AHEAD) so
+inserts land in their month rather than in product_history_default, moving
+any rows that already fell into the default, and detaches partitions older than
+HISTORY_RETAIN_MONTHS. With --archive-dir, detached partitions are written to
+gzipped CSV files in that directory and dropped.
+"""
+import argparse
+
+from sqlalchemy import create_engine
+
+from config import POSTGRES_DB, POSTGRES_USER, POSTGRES_PASSWORD, POSTGRES_HOST, POSTGRES_PORT, \
+    HISTORY_PARTITIONS_AHEAD, HISTORY_RETAIN_MONTHS, HISTORY_ARCHIVE_DIR
+from warehouse.partitions import maintain_history_partitions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--ahead', type=int, default=HISTORY_PARTITIONS_AHEAD)
+    parser.add_argument('--retain-months', type=int, default=HISTORY_RETAIN_MONTHS)
+    parser.add_argument('--archive-dir', default=HISTORY_ARCHIVE_DIR)
+    args = parser.parse_args()
+
+    engine = create_engine(
+        f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}")
+    with engine.begin() as conn:
+        result = maintain_history_partitions(conn, args.ahead, args.retain_months, args.archive_dir)
+    for action, names in result.items():
+        for name in names:
+            print(f'{action:9} {name}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+import os
+import tempfile
+from unittest import IsolatedAsyncioTestCase
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+import database
+from database import configure_replicas, create_db_engine, open_read_session
+
+
+class ReadReplicaRoutingTest(IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.urls = []
+        for name in ('replica1', 'replica2', 'primary'):
+            url = f"sqlite+aiosqlite:///{os.path.join(self.tmp.name, name + '.db')}"
+            db_engine = create_db_engine(url)
+            async with db_engine.begin() as conn:
+                await conn.execute(text('CREATE TABLE marker (name VARCHAR)'))
+                await conn.execute(text('INSERT INTO marker VALUES (:name)'), {'name': name})
+            await db_engine.dispose()
+            self.urls.append(url)
+        self.primary_engine = create_db_engine(self.urls[2])
+        self.original_session_maker = database.async_session_maker
+        database.async_session_maker = sessionmaker(self.primary_engine, class_=AsyncSession)
+
+    async def asyncTearDown(self):
+        for replica_engine in database.replica_engines:
+            await replica_engine.dispose()
+        configure_replicas([])
+        database.async_session_maker = self.original_session_maker
+        await self.primary_engine.dispose()
+        self.tmp.cleanup()
+
+    async def read_marker(self):
+        async with await open_read_session() as session:
+            return (await session.execute(text('SELECT name FROM marker'))).scalar_one()
+
+    async def test_round_robin(self):
+        configure_replicas(self.urls[:2])
+        names = [await self.read_marker() for _ in range(4)]
+        self.assertEqual(names, ['replica1', 'replica2', 'replica1', 'replica2'])
+
+    async def test_fallback_to_primary(self):
+        configure_replicas([f"sqlite+aiosqlite:///{os.path.join(self.tmp.name, 'missing', 'replica.db')}"])
+        self.assertEqual(await self.read_marker(), 'primary')
+
+    async def test_skips_unavailable_replica(self):
+        configure_replicas([f"sqlite+aiosqlite:///{os.path.join(self.tmp.name, 'missing', 'replica.db')}", self.urls[0]])
+        names = [await self.read_marker() for _ in range(3)]
+        self.assertEqual(names, ['replica1', 'replica1', 'replica1'])
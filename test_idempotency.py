@@ -0,0 +1,35 @@
+import time
+from unittest import TestCase
+from unittest.mock import patch
+
+from fastapi import HTTPException
+
+import idempotency
+from idempotency import IdempotencyKey, _cache_get, _cache_put, _response_cache
+
+
+class ResponseCacheTest(TestCase):
+    def setUp(self):
+        _response_cache.clear()
+
+    def test_least_recently_used_entry_is_evicted(self):
+        with patch.object(idempotency, 'IDEMPOTENCY_CACHE_SIZE', 2):
+            _cache_put(('a', '1'), (time.time() + 60, 'h', 200, {}))
+            _cache_put(('a', '2'), (time.time() + 60, 'h', 200, {}))
+            _cache_get(('a', '1'))
+            _cache_put(('a', '3'), (time.time() + 60, 'h', 200, {}))
+        self.assertEqual(list(_response_cache), [('a', '1'), ('a', '3')])
+
+    def test_expired_entry_is_dropped(self):
+        _cache_put(('a', '1'), (time.time() - 1, 'h', 200, {}))
+        self.assertIsNone(_cache_get(('a', '1')))
+        self.assertNotIn(('a', '1'), _response_cache)
+
+    def test_replay_rejects_a_different_request(self):
+        key = IdempotencyKey(request=None, key='k')
+        key.request_hash = 'first'
+        response = key._replay('first', 201, {'id': 1})
+        self.assertEqual((response.status_code, response.headers['Idempotent-Replayed']), (201, 'true'))
+        with self.assertRaises(HTTPException) as error:
+            key._replay('second', 201, {'id': 1})
+        self.assertEqual(error.exception.status_code, 422)
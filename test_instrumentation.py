@@ -0,0 +1,25 @@
+from unittest import TestCase
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from instrumentation import RequestQueryStats, _request_stats
+
+
+class QueryTimingTest(TestCase):
+    def test_failed_statements_leave_nothing_on_the_connection(self):
+        engine = create_engine('sqlite://')
+        stats = RequestQueryStats()
+        token = _request_stats.set(stats)
+        try:
+            with engine.connect() as conn:
+                for _ in range(3):
+                    with self.assertRaises(OperationalError):
+                        conn.execute(text('SELECT * FROM missing'))
+                conn.execute(text('SELECT 1'))
+                self.assertNotIn('query_start_time', conn.info)
+        finally:
+            _request_stats.reset(token)
+            engine.dispose()
+        self.assertEqual(stats.count, 1)
+        self.assertEqual(stats.slowest_statement, 'SELECT 1')
@@ -0,0 +1,44 @@
+from datetime import datetime
+from unittest import TestCase
+
+from fastapi import HTTPException
+from sqlalchemy.dialects import postgresql
+
+from models.models import OrderDetail, ProductLocation, User
+from pagination import encode_cursor, decode_cursor, projection_columns, keyset_after
+
+
+class CursorTest(TestCase):
+    def test_round_trip(self):
+        created_at = datetime(2024, 3, 5, 18, 34, 5, 359909)
+        order_by = [OrderDetail.created_at, OrderDetail.id]
+        cursor = encode_cursor([created_at, 42])
+        self.assertEqual(decode_cursor(cursor, order_by), [created_at, 42])
+
+    def test_invalid_cursor(self):
+        for cursor in ('not-a-cursor', encode_cursor([1, 2, 3]), encode_cursor({'id': 1})):
+            with self.assertRaises(HTTPException):
+                decode_cursor(cursor, [User.id])
+
+    def test_projection_keeps_order_columns_and_hides_fields(self):
+        columns = projection_columns(User, 'login, email', [User.id], hidden=('password',))
+        self.assertEqual([column.key for column in columns], ['login', 'email', 'id'])
+        with self.assertRaises(HTTPException):
+            projection_columns(User, 'password', [User.id], hidden=('password',))
+
+    def test_keyset_spells_out_nullable_keys(self):
+        def sql(condition):
+            return str(condition.compile(dialect=postgresql.dialect(), compile_kwargs={'literal_binds': True}))
+
+        self.assertEqual(sql(keyset_after([User.id], [5])), '("user".id) > (5)')
+        order_by = [ProductLocation.warehouse_id, ProductLocation.id]
+        self.assertEqual(
+            sql(keyset_after(order_by, [3, 10])),
+            'product_location.warehouse_id > 3 OR product_location.warehouse_id IS NULL '
+            'OR product_location.warehouse_id = 3 AND product_location.id > 10'
+        )
+        self.assertEqual(
+            sql(keyset_after(order_by, [None, 10])),
+            'false OR product_location.warehouse_id IS NULL AND product_location.id > 10'
+        )
+        self.assertIn('created_at IS NOT NULL', sql(keyset_after([OrderDetail.created_at, OrderDetail.id], [None, 1], True)))
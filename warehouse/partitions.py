@@ -0,0 +1,122 @@
+import gzip
+import os
+import re
+from datetime import datetime
+
+from sqlalchemy import text
+
+HISTORY_TABLE = 'product_history'
+DEFAULT_PARTITION = f'{HISTORY_TABLE}_default'
+PARTITION_NAME = re.compile(r'^product_history_y(\d{4})m(\d{2})$')
+
+
+def month_start(value: datetime) -> datetime:
+    return datetime(value.year, value.month, 1)
+
+
+def add_months(month: datetime, count: int) -> datetime:
+    index = month.year * 12 + month.month - 1 + count
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: datetime) -> str:
+    return f'{HISTORY_TABLE}_y{month:%Y}m{month:%m}'
+
+
+def list_partitions(conn):
+    """Return ``{month: attached}`` for every monthly history table, attached to the parent or not."""
+    rows = conn.execute(text("""
+        SELECT c.relname, i.inhparent IS NOT NULL
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace AND n.nspname = current_schema()
+        LEFT JOIN pg_inherits i ON i.inhrelid = c.oid AND i.inhparent = CAST(:parent AS regclass)
+        WHERE c.relkind = 'r' AND c.relname LIKE :pattern
+    """), {'parent': HISTORY_TABLE, 'pattern': f'{HISTORY_TABLE}_y%'}).all()
+    partitions = {}
+    for name, attached in rows:
+        match = PARTITION_NAME.match(name)
+        if match:
+            partitions[datetime(int(match.group(1)), int(match.group(2)), 1)] = attached
+    return partitions
+
+
+def has_default_partition(conn) -> bool:
+    return conn.execute(text('SELECT to_regclass(:name) IS NOT NULL'), {'name': DEFAULT_PARTITION}).scalar_one()
+
+
+def create_partitions(conn, first: datetime, last: datetime):
+    """Create the monthly partitions from ``first`` through ``last`` that do not exist yet.
+
+    Rows of a missing month sit in the default partition, and Postgres refuses a new partition whose range the
+    default still holds rows for. So with a default partition each month is built as a plain table, its rows are
+    moved out of the default and the table is then attached, with the default locked against inserts meanwhile.
+    """
+    existing = list_partitions(conn)
+    default = has_default_partition(conn)
+    created = []
+    month = month_start(first)
+    while month <= last:
+        following = add_months(month, 1)
+        name = partition_name(month)
+        bounds = f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{following:%Y-%m-%d}')"
+        if month not in existing and default:
+            conn.execute(text(f'LOCK TABLE {DEFAULT_PARTITION} IN ACCESS EXCLUSIVE MODE'))
+            conn.execute(text(f'CREATE TABLE {name} (LIKE {HISTORY_TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'))
+            conn.execute(text(f"""
+                WITH moved AS (
+                    DELETE FROM {DEFAULT_PARTITION} WHERE last_update >= :start AND last_update < :end RETURNING *
+                )
+                INSERT INTO {name} SELECT * FROM moved
+            """), {'start': month, 'end': following})
+            conn.execute(text(f'ALTER TABLE {HISTORY_TABLE} ATTACH PARTITION {name} {bounds}'))
+            created.append(name)
+        elif month not in existing:
+            conn.execute(text(f'CREATE TABLE {name} PARTITION OF {HISTORY_TABLE} {bounds}'))
+            created.append(name)
+        month = following
+    return created
+
+
+def detach_partitions(conn, before: datetime):
+    """Detach the attached partitions whose month starts before ``before``; the tables are kept."""
+    detached = []
+    for month, attached in sorted(list_partitions(conn).items()):
+        if attached and month < before:
+            conn.execute(text(f'ALTER TABLE {HISTORY_TABLE} DETACH PARTITION {partition_name(month)}'))
+            detached.append(partition_name(month))
+    return detached
+
+
+def archive_partition(conn, name: str, directory: str) -> str:
+    """Write a detached partition to ``<directory>/<name>.csv.gz`` and drop the table once the file is on disk."""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'{name}.csv.gz')
+    partial = f'{path}.partial'
+    cursor = conn.connection.cursor()
+    try:
+        with gzip.open(partial, 'wb') as file:
+            cursor.copy_expert(f'COPY {name} TO STDOUT WITH (FORMAT csv, HEADER)', file)
+            file.flush()
+            os.fsync(file.fileno())
+    finally:
+        cursor.close()
+    os.replace(partial, path)
+    conn.execute(text(f'DROP TABLE {name}'))
+    return path
+
+
+def maintain_history_partitions(conn, ahead: int, retain_months: int, archive_dir=None, now=None):
+    """Create partitions ``ahead`` months into the future and detach those older than ``retain_months``.
+
+    With ``archive_dir`` every detached partition, including ones detached by earlier runs, is archived and
+    dropped. ``retain_months=0`` keeps all history attached.
+    """
+    current = month_start(now or datetime.utcnow())
+    result = {'created': create_partitions(conn, current, add_months(current, ahead)), 'detached': [], 'archived': []}
+    if retain_months:
+        result['detached'] = detach_partitions(conn, add_months(current, -retain_months))
+    if archive_dir:
+        for month, attached in sorted(list_partitions(conn).items()):
+            if not attached:
+                result['archived'].append(archive_partition(conn, partition_name(month), archive_dir))
+    return result
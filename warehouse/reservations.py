@@ -0,0 +1,135 @@
+import logging
+from datetime import datetime, timedelta
+
+from fastapi import HTTPException
+from sqlalchemy import select, insert, update, delete, func, values, column, Integer
+
+from config import RESERVATION_TTL_SECONDS, RESERVATION_SWEEP_INTERVAL, RESERVATION_SWEEP_BATCH
+from database import run_batched_cleanup
+from models.models import StockReservation, ProductLocation
+from .utils import lock_product_locations, reserved_amounts
+
+logger = logging.getLogger('warehouse.reservations')
+
+
+def line_totals(lines) -> dict:
+    """Sum ``(product_id, warehouse_id, count)`` lines into ``{(product_id, warehouse_id): count}``."""
+    totals = {}
+    for product_id, warehouse_id, count in lines:
+        totals[(product_id, warehouse_id)] = totals.get((product_id, warehouse_id), 0) + count
+    return totals
+
+
+def check_available(totals: dict, on_hand: dict, reserved: dict):
+    shortages = [
+        {
+            'product_id': product_id, 'warehouse_id': warehouse_id, 'requested': count,
+            'available': max(on_hand.get((product_id, warehouse_id), 0) - reserved.get((product_id, warehouse_id), 0), 0)
+        }
+        for (product_id, warehouse_id), count in totals.items()
+        if on_hand.get((product_id, warehouse_id), 0) - reserved.get((product_id, warehouse_id), 0) < count
+    ]
+    if shortages:
+        raise HTTPException(status_code=400, detail={'message': 'Product is not enough', 'shortages': shortages})
+
+
+async def insert_reservations(session, reservations) -> datetime:
+    """Insert ``(order_detail_id, totals)`` reservations in one statement; returns their expiry."""
+    expires_at = datetime.utcnow() + timedelta(seconds=RESERVATION_TTL_SECONDS)
+    await session.execute(insert(StockReservation).values([
+        {
+            'order_detail_id': order_detail_id, 'product_id': product_id, 'warehouse_id': warehouse_id,
+            'amount': count, 'expires_at': expires_at
+        }
+        for order_detail_id, totals in reservations
+        for (product_id, warehouse_id), count in totals.items()
+    ]))
+    return expires_at
+
+
+async def reserve_stock(session, order_detail_id: int, lines) -> datetime:
+    """Hold ``lines`` for an order until they are confirmed or RESERVATION_TTL_SECONDS pass; the caller commits.
+
+    The stock rows stay locked until the caller's transaction ends, so concurrent orders for the same stock
+    check and reserve one after another.
+    """
+    totals = line_totals(lines)
+    on_hand = await lock_product_locations(session, totals)
+    check_available(totals, on_hand, await reserved_amounts(session, totals))
+    return await insert_reservations(session, [(order_detail_id, totals)])
+
+
+async def admit_orders(session, batch) -> list:
+    """Check a batch of orders' ``line_totals`` against stock in arrival order, under one set of row locks.
+
+    Returns ``None`` for every order that still fits after the ones admitted before it and the shortage
+    ``HTTPException`` for every order that does not.
+    """
+    keys = {key for totals in batch for key in totals}
+    on_hand = await lock_product_locations(session, keys)
+    reserved = await reserved_amounts(session, keys)
+    errors = []
+    for totals in batch:
+        try:
+            check_available(totals, on_hand, reserved)
+        except HTTPException as error:
+            errors.append(error)
+            continue
+        for key, count in totals.items():
+            reserved[key] = reserved.get(key, 0) + count
+        errors.append(None)
+    return errors
+
+
+async def confirm_reservations(session, order_detail_id: int, lines):
+    """Deduct an order's lines from stock and drop its reservations; the caller commits.
+
+    The locations are locked in key order first, so overlapping confirms queue instead of deadlocking. A single
+    ``UPDATE ... FROM (VALUES ...)`` then decrements every location that still has enough stock not reserved by
+    other orders, and any key missing from its RETURNING rows is a shortage. An order whose reservation expired is
+    confirmed if the stock is still free.
+    """
+    totals = line_totals(lines)
+    on_hand = await lock_product_locations(session, totals)
+    order_lines = values(
+        column('product_id', Integer), column('warehouse_id', Integer), column('count', Integer), name='order_lines'
+    ).data([(product_id, warehouse_id, count) for (product_id, warehouse_id), count in totals.items()])
+    reserved_by_others = select(func.coalesce(func.sum(StockReservation.amount), 0)).where(
+        (StockReservation.product_id == ProductLocation.product_id) &
+        (StockReservation.warehouse_id == ProductLocation.warehouse_id) &
+        (StockReservation.expires_at > datetime.utcnow()) &
+        (StockReservation.order_detail_id != order_detail_id)
+    ).correlate(ProductLocation).scalar_subquery()
+    query = update(ProductLocation).where(
+        (ProductLocation.product_id == order_lines.c.product_id) &
+        (ProductLocation.warehouse_id == order_lines.c.warehouse_id) &
+        (ProductLocation.product_amount - reserved_by_others >= order_lines.c.count)
+    ).values(
+        product_amount=ProductLocation.product_amount - order_lines.c.count
+    ).returning(ProductLocation.product_id, ProductLocation.warehouse_id)
+    result = await session.execute(query, execution_options={'synchronize_session': False})
+    short = set(totals) - set(result.tuples().all())
+    if short:
+        shortages = {key: totals[key] for key in short}
+        reserved = await reserved_amounts(session, short, exclude_order_detail_id=order_detail_id)
+        check_available(shortages, on_hand, reserved)
+        raise HTTPException(status_code=400, detail='Product is not enough')
+    await session.execute(delete(StockReservation).where(StockReservation.order_detail_id == order_detail_id))
+
+
+async def release_expired_reservations(session, batch_size: int = RESERVATION_SWEEP_BATCH) -> int:
+    """Delete up to ``batch_size`` expired reservations, skipping rows another transaction holds."""
+    expired = select(StockReservation.id).where(
+        StockReservation.expires_at <= datetime.utcnow()
+    ).order_by(StockReservation.expires_at).limit(batch_size).with_for_update(skip_locked=True)
+    result = await session.execute(
+        delete(StockReservation).where(StockReservation.id.in_(expired.scalar_subquery())),
+        execution_options={'synchronize_session': False}
+    )
+    return result.rowcount
+
+
+async def sweep_expired_reservations(interval: float = RESERVATION_SWEEP_INTERVAL,
+                                     batch_size: int = RESERVATION_SWEEP_BATCH):
+    """Release expired reservations every ``interval`` seconds, committing one batch at a time."""
+    await run_batched_cleanup(release_expired_reservations, interval, batch_size, logger)
@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import List
+from typing import List, Union
 
 from pydantic import BaseModel, Field
 
@@ -11,6 +11,15 @@ class WarehouseGetScheme(BaseModel):
     longitude: float
 
 
+class NearestWarehouseScheme(BaseModel):
+    id: int
+    name: str
+    latitude: float
+    longitude: float
+    amount: int
+    distance_km: float
+
+
 class WarehouseAddScheme(BaseModel):
     name: str
     latitude: float
@@ -37,6 +46,10 @@ class UpdatePLScheme(BaseModel):
     amount: int = Field(gt=0)
 
 
+class BulkTransferScheme(BaseModel):
+    moves: List[UpdatePLScheme] = Field(min_length=1, max_length=5000)
+
+
 class WarehouseProductScheme(BaseModel):
     id: int
     name: str
@@ -45,6 +58,8 @@ class WarehouseProductScheme(BaseModel):
     amount: int = Field(gte=0)
     unit_id: int
     price: float
+    category_name: Union[str, None] = None
+    unit_name: Union[str, None] = None
 
 
 class CategoriesScheme(BaseModel):
@@ -0,0 +1,135 @@
+import heapq
+import math
+import time
+
+from sqlalchemy import select
+
+from config import WAREHOUSE_INDEX_TTL
+from database import on_table_write
+from models.models import Warehouse, ProductLocation
+from .utils import reserved_amounts
+
+EARTH_RADIUS_KM = 6371.0088
+
+_index = None
+_index_generation = 0
+
+
+def to_unit_vector(latitude: float, longitude: float):
+    """Project a coordinate onto the unit sphere, where straight-line order matches great-circle order."""
+    lat, lon = math.radians(latitude), math.radians(longitude)
+    return math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat)
+
+
+def chord_to_km(squared_chord: float) -> float:
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(squared_chord) / 2))
+
+
+class WarehouseIndex:
+    """Static 3-d KD-tree over warehouse coordinates.
+
+    Nodes are ``(point, axis, left, right)`` tuples where ``point`` is ``(x, y, z, warehouse_id)``.
+    """
+
+    def __init__(self, warehouses):
+        self.warehouses = {warehouse_id: (name, lat, lon) for warehouse_id, name, lat, lon in warehouses}
+        self.points = {
+            warehouse_id: (*to_unit_vector(lat, lon), warehouse_id)
+            for warehouse_id, (name, lat, lon) in self.warehouses.items()
+        }
+        self.root = self._build(list(self.points.values()), 0)
+
+    def __len__(self):
+        return len(self.points)
+
+    def _build(self, points, axis):
+        if not points:
+            return None
+        points.sort(key=lambda point: point[axis])
+        middle = len(points) // 2
+        following = (axis + 1) % 3
+        return points[middle], axis, self._build(points[:middle], following), self._build(points[middle + 1:], following)
+
+    def nearest(self, latitude: float, longitude: float, k: int, allowed=None):
+        """Return up to ``k`` ``(distance_km, warehouse_id)`` pairs, nearest first, limited to ``allowed`` ids."""
+        target = to_unit_vector(latitude, longitude)
+        if allowed is not None and len(allowed) * 4 < len(self.points):
+            # Few candidates: ranking them directly beats walking a tree that would reject most nodes.
+            candidates = [
+                (sum((a - b) ** 2 for a, b in zip(self.points[warehouse_id], target)), warehouse_id)
+                for warehouse_id in allowed if warehouse_id in self.points
+            ]
+            return [(chord_to_km(distance), warehouse_id) for distance, warehouse_id in heapq.nsmallest(k, candidates)]
+
+        heap = []
+
+        def visit(node):
+            if node is None:
+                return
+            point, axis, left, right = node
+            distance = (point[0] - target[0]) ** 2 + (point[1] - target[1]) ** 2 + (point[2] - target[2]) ** 2
+            if allowed is None or point[3] in allowed:
+                if len(heap) < k:
+                    heapq.heappush(heap, (-distance, point[3]))
+                elif distance < -heap[0][0]:
+                    heapq.heapreplace(heap, (-distance, point[3]))
+            offset = target[axis] - point[axis]
+            near, far = (left, right) if offset < 0 else (right, left)
+            visit(near)
+            if len(heap) < k or offset * offset < -heap[0][0]:
+                visit(far)
+
+        visit(self.root)
+        return [(chord_to_km(-distance), warehouse_id) for distance, warehouse_id in sorted(heap, reverse=True)]
+
+
+def invalidate_warehouse_index():
+    global _index, _index_generation
+    _index_generation += 1
+    _index = None
+
+
+on_table_write([Warehouse], invalidate_warehouse_index)
+
+
+async def get_warehouse_index(session) -> WarehouseIndex:
+    """Return the cached warehouse index.
+
+    Local warehouse writes drop it at once; the TTL bounds how long writes made by other workers, or still on their
+    way to a replica, go unseen.
+    """
+    global _index
+    if _index is not None and _index[0] > time.monotonic():
+        return _index[1]
+    generation = _index_generation
+    query = select(Warehouse.id, Warehouse.name, Warehouse.latitude, Warehouse.longitude).where(
+        Warehouse.latitude.is_not(None) & Warehouse.longitude.is_not(None)
+    )
+    index = WarehouseIndex((await session.execute(query)).all())
+    if generation == _index_generation:
+        _index = (time.monotonic() + WAREHOUSE_INDEX_TTL, index)
+    return index
+
+
+async def nearest_warehouses(session, product_id: int, latitude: float, longitude: float, min_amount: int = 1,
+                             k: int = 5):
+    """Return the ``k`` warehouses nearest to a point with at least ``min_amount`` unreserved ``product_id``."""
+    index = await get_warehouse_index(session)
+    query = select(ProductLocation.warehouse_id, ProductLocation.product_amount).where(
+        (ProductLocation.product_id == product_id) & (ProductLocation.product_amount >= min_amount)
+    )
+    on_hand = dict((await session.execute(query)).all())
+    reserved = await reserved_amounts(session, [(product_id, warehouse_id) for warehouse_id in on_hand])
+    stock = {}
+    for warehouse_id, amount in on_hand.items():
+        available = amount - reserved.get((product_id, warehouse_id), 0)
+        if available >= min_amount:
+            stock[warehouse_id] = available
+    result = []
+    for distance, warehouse_id in index.nearest(latitude, longitude, k, allowed=stock):
+        name, lat, lon = index.warehouses[warehouse_id]
+        result.append({
+            'id': warehouse_id, 'name': name, 'latitude': lat, 'longitude': lon,
+            'amount': stock[warehouse_id], 'distance_km': distance
+        })
+    return result
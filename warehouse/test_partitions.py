@@ -0,0 +1,18 @@
+from datetime import datetime
+from unittest import TestCase
+
+from warehouse.partitions import add_months, month_start, partition_name, PARTITION_NAME
+
+
+class PartitionNamingTest(TestCase):
+    def test_add_months_rolls_over_years(self):
+        self.assertEqual(add_months(datetime(2024, 11, 1), 3), datetime(2025, 2, 1))
+        self.assertEqual(add_months(datetime(2024, 1, 1), -1), datetime(2023, 12, 1))
+        self.assertEqual(add_months(datetime(2024, 5, 1), -24), datetime(2022, 5, 1))
+
+    def test_partition_name_round_trips(self):
+        month = month_start(datetime(2024, 7, 19, 13, 5))
+        name = partition_name(month)
+        self.assertEqual(name, 'product_history_y2024m07')
+        match = PARTITION_NAME.match(name)
+        self.assertEqual(datetime(int(match.group(1)), int(match.group(2)), 1), month)
@@ -0,0 +1,19 @@
+from unittest import TestCase
+
+from fastapi import HTTPException
+
+from warehouse.reservations import check_available, line_totals
+
+
+class ReservationCheckTest(TestCase):
+    def test_line_totals_merges_repeated_lines(self):
+        self.assertEqual(line_totals([(1, 10, 2), (1, 10, 3), (2, 10, 1)]), {(1, 10): 5, (2, 10): 1})
+
+    def test_reserved_stock_is_not_available(self):
+        check_available({(1, 10): 3}, {(1, 10): 5}, {(1, 10): 2})
+        with self.assertRaises(HTTPException) as error:
+            check_available({(1, 10): 4, (2, 10): 1}, {(1, 10): 5}, {(1, 10): 2})
+        self.assertEqual(error.exception.detail['shortages'], [
+            {'product_id': 1, 'warehouse_id': 10, 'requested': 4, 'available': 3},
+            {'product_id': 2, 'warehouse_id': 10, 'requested': 1, 'available': 0},
+        ])
@@ -0,0 +1,53 @@
+import math
+import random
+from unittest import TestCase
+
+from warehouse.spatial import WarehouseIndex, EARTH_RADIUS_KM
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+class WarehouseIndexTest(TestCase):
+    def setUp(self):
+        rng = random.Random(7)
+        self.warehouses = [
+            (warehouse_id, f'w{warehouse_id}', rng.uniform(-80, 80), rng.uniform(-180, 180))
+            for warehouse_id in range(1, 501)
+        ]
+        self.index = WarehouseIndex(self.warehouses)
+
+    def brute_force(self, lat, lon, k, allowed=None):
+        ranked = sorted(
+            (haversine_km(lat, lon, w_lat, w_lon), warehouse_id)
+            for warehouse_id, name, w_lat, w_lon in self.warehouses
+            if allowed is None or warehouse_id in allowed
+        )
+        return ranked[:k]
+
+    def assertSameNearest(self, expected, actual):
+        self.assertEqual([warehouse_id for _, warehouse_id in expected], [warehouse_id for _, warehouse_id in actual])
+        for (expected_km, _), (actual_km, _) in zip(expected, actual):
+            self.assertAlmostEqual(expected_km, actual_km, places=3)
+
+    def test_matches_brute_force(self):
+        rng = random.Random(11)
+        for _ in range(50):
+            lat, lon = rng.uniform(-90, 90), rng.uniform(-180, 180)
+            self.assertSameNearest(self.brute_force(lat, lon, 5), self.index.nearest(lat, lon, 5))
+
+    def test_filters_by_allowed_warehouses(self):
+        rng = random.Random(13)
+        dense = set(rng.sample(range(1, 501), 300))
+        sparse = set(rng.sample(range(1, 501), 10))
+        for allowed in (dense, sparse):
+            self.assertSameNearest(self.brute_force(41.3, 69.2, 3, allowed), self.index.nearest(41.3, 69.2, 3, allowed))
+
+    def test_handles_antimeridian_and_small_sets(self):
+        index = WarehouseIndex([(1, 'east', 0.0, 179.9), (2, 'west', 0.0, -179.9), (3, 'far', 0.0, 90.0)])
+        self.assertEqual([warehouse_id for _, warehouse_id in index.nearest(0.0, 179.95, 2)], [1, 2])
+        self.assertEqual(index.nearest(0.0, 0.0, 5, allowed=set()), [])
+        self.assertEqual(WarehouseIndex([]).nearest(0.0, 0.0, 3), [])
@@ -0,0 +1,134 @@
+import asyncio
+import os
+import random
+from datetime import datetime, timedelta
+from unittest import IsolatedAsyncioTestCase, skipUnless
+
+from fastapi import HTTPException
+from sqlalchemy import func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from models.models import metadata, Category, Unit, Product, Warehouse, ProductLocation, ProductHistory, \
+    StockReservation
+from warehouse.utils import transfer_stock, import_product_locations
+
+TEST_DATABASE_URL = os.getenv('TEST_DATABASE_URL')
+WAREHOUSES = 6
+PRODUCTS = 3
+INITIAL_AMOUNT = 500
+TRANSFERS = 2000
+CONCURRENCY = 30
+
+
+class ScratchDatabaseTest(IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.engine = create_async_engine(TEST_DATABASE_URL, pool_size=CONCURRENCY, max_overflow=0)
+        self.session_maker = sessionmaker(self.engine, class_=AsyncSession, expire_on_commit=False)
+        async with self.engine.begin() as conn:
+            await conn.run_sync(metadata.drop_all)
+            await conn.run_sync(metadata.create_all)
+            await conn.execute(insert(Category).values(id=1, name='category'))
+            await conn.execute(insert(Unit).values(id=1, code='pcs', name='piece'))
+            await conn.execute(insert(Warehouse), [{'id': i, 'name': f'w{i}'} for i in range(1, WAREHOUSES + 1)])
+            await conn.execute(insert(Product), [
+                {'id': i, 'name': f'p{i}', 'category_id': 1, 'unit_id': 1, 'price': 1} for i in range(1, PRODUCTS + 1)
+            ])
+            await conn.execute(insert(ProductLocation), [
+                {'product_id': product_id, 'warehouse_id': 1, 'product_amount': INITIAL_AMOUNT}
+                for product_id in range(1, PRODUCTS + 1)
+            ])
+
+    async def asyncTearDown(self):
+        async with self.engine.begin() as conn:
+            await conn.run_sync(metadata.drop_all)
+        await self.engine.dispose()
+
+
+@skipUnless(TEST_DATABASE_URL, 'TEST_DATABASE_URL points at a scratch PostgreSQL database')
+class TransferStockStressTest(ScratchDatabaseTest):
+    async def test_parallel_transfers_conserve_stock(self):
+        semaphore = asyncio.Semaphore(CONCURRENCY)
+        rng = random.Random(7)
+        moves = [
+            (rng.randint(1, PRODUCTS), *rng.sample(range(1, WAREHOUSES + 1), 2), rng.randint(1, 40))
+            for _ in range(TRANSFERS)
+        ]
+
+        async def move(product_id, warehouse_old_id, warehouse_new_id, amount):
+            async with semaphore, self.session_maker() as session:
+                try:
+                    await transfer_stock(session, product_id, warehouse_old_id, warehouse_new_id, amount)
+                    await session.commit()
+                    return True
+                except HTTPException:
+                    await session.rollback()
+                    return False
+
+        results = await asyncio.gather(*[move(*args) for args in moves])
+
+        async with self.session_maker() as session:
+            totals = dict((await session.execute(
+                select(ProductLocation.product_id, func.sum(ProductLocation.product_amount))
+                .group_by(ProductLocation.product_id))).all())
+            negative = (await session.execute(
+                select(func.count()).where(ProductLocation.product_amount < 0))).scalar_one()
+            duplicates = (await session.execute(
+                select(func.count()).select_from(
+                    select(ProductLocation.product_id).group_by(
+                        ProductLocation.product_id, ProductLocation.warehouse_id
+                    ).having(func.count() > 1).subquery()))).scalar_one()
+            history = (await session.execute(select(func.count()).select_from(ProductHistory))).scalar_one()
+
+        self.assertEqual(totals, {product_id: INITIAL_AMOUNT for product_id in range(1, PRODUCTS + 1)})
+        self.assertEqual(negative, 0)
+        self.assertEqual(duplicates, 0)
+        self.assertEqual(history, sum(results))
+        self.assertGreater(sum(results), TRANSFERS // 2)
+
+
+async def stream(*chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+@skipUnless(TEST_DATABASE_URL, 'TEST_DATABASE_URL points at a scratch PostgreSQL database')
+class ImportReservedStockTest(ScratchDatabaseTest):
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        async with self.session_maker() as session:
+            await session.execute(insert(StockReservation).values(
+                product_id=1, warehouse_id=1, amount=200, expires_at=datetime.utcnow() + timedelta(minutes=5)
+            ))
+            await session.execute(insert(StockReservation).values(
+                product_id=2, warehouse_id=1, amount=400, expires_at=datetime.utcnow() - timedelta(minutes=5)
+            ))
+            await session.commit()
+
+    async def amounts(self):
+        async with self.session_maker() as session:
+            return dict((await session.execute(
+                select(ProductLocation.product_id, ProductLocation.product_amount)
+                .where(ProductLocation.warehouse_id == 1))).all())
+
+    async def test_replace_refuses_to_go_below_reservations(self):
+        async with self.session_maker() as session:
+            with self.assertRaises(HTTPException) as error:
+                await import_product_locations(session, stream(
+                    b'product_id,warehouse_id,product_amount\n1,1,150\n2,1,100\n'
+                ))
+            await session.rollback()
+        self.assertEqual(error.exception.status_code, 400)
+        self.assertEqual(error.exception.detail['rows'], [
+            {'product_id': 1, 'warehouse_id': 1, 'product_amount': 150, 'reserved': 200}
+        ])
+        self.assertEqual(await self.amounts(), {product_id: INITIAL_AMOUNT for product_id in range(1, PRODUCTS + 1)})
+
+    async def test_replace_keeps_reserved_units(self):
+        async with self.session_maker() as session:
+            result = await import_product_locations(session, stream(
+                b'product_id,warehouse_id,product_amount\n1,1,200\n2,1,100\n'
+            ))
+            await session.commit()
+        self.assertEqual(result['merged'], 2)
+        self.assertEqual(await self.amounts(), {1: 200, 2: 100, 3: INITIAL_AMOUNT})
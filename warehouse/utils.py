@@ -0,0 +1,326 @@
+import csv
+import io
+import json
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from fastapi import HTTPException
+from sqlalchemy import select, update, insert, tuple_, text, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from config import IMPORT_BATCH_SIZE, EXPORT_BATCH_SIZE
+from database import open_read_session
+from models.models import ProductLocation, ProductHistory, Product, Warehouse, StockReservation
+
+IMPORT_COLUMNS = ['product_id', 'warehouse_id', 'product_amount']
+HISTORY_EXPORT_COLUMNS = [
+    'id', 'product_id', 'product_name', 'warehouse_old_id', 'warehouse_new_id', 'amount', 'last_update'
+]
+
+
+async def lock_product_locations(session, keys):
+    """Lock the product_location rows for ``(product_id, warehouse_id)`` keys in a fixed order.
+
+    Every writer that touches more than one stock row takes its locks through here, so concurrent transfers
+    always lock in the same order and cannot deadlock each other.
+    """
+    keys = sorted(set(keys))
+    query = select(ProductLocation.product_id, ProductLocation.warehouse_id, ProductLocation.product_amount).where(
+        tuple_(ProductLocation.product_id, ProductLocation.warehouse_id).in_(keys)
+    ).order_by(ProductLocation.product_id, ProductLocation.warehouse_id).with_for_update()
+    data = await session.execute(query)
+    return {(product_id, warehouse_id): amount for product_id, warehouse_id, amount in data.all()}
+
+
+async def add_stock(session, rows):
+    """Add ``(product_id, warehouse_id, amount)`` rows to stock, creating missing locations.
+
+    Rows are written in ``(product_id, warehouse_id)`` order, the order ``lock_product_locations`` uses, so
+    concurrent upserts that create the same locations queue on the unique index instead of deadlocking.
+    """
+    query = pg_insert(ProductLocation).values([
+        {'product_id': product_id, 'warehouse_id': warehouse_id, 'product_amount': amount}
+        for product_id, warehouse_id, amount in sorted(rows, key=lambda row: (row[0], row[1]))
+    ])
+    query = query.on_conflict_do_update(
+        index_elements=[ProductLocation.product_id, ProductLocation.warehouse_id],
+        set_={'product_amount': ProductLocation.product_amount + query.excluded.product_amount}
+    )
+    await session.execute(query)
+
+
+async def reserved_amounts(session, keys, exclude_order_detail_id=None) -> dict:
+    """Sum the active reservations for ``(product_id, warehouse_id)`` keys in one aggregate over the covering index."""
+    keys = list(keys)
+    if not keys:
+        return {}
+    query = select(StockReservation.product_id, StockReservation.warehouse_id, func.sum(StockReservation.amount)).where(
+        tuple_(StockReservation.product_id, StockReservation.warehouse_id).in_(keys) &
+        (StockReservation.expires_at > datetime.utcnow())
+    ).group_by(StockReservation.product_id, StockReservation.warehouse_id)
+    if exclude_order_detail_id is not None:
+        query = query.where(StockReservation.order_detail_id != exclude_order_detail_id)
+    return {(product_id, warehouse_id): amount for product_id, warehouse_id, amount in (await session.execute(query)).all()}
+
+
+async def take_stock(session, product_id: int, warehouse_id: int, amount: int):
+    """Decrement stock only if enough is left unreserved; returns the remaining amount or ``None`` when short."""
+    reserved = select(func.coalesce(func.sum(StockReservation.amount), 0)).where(
+        (StockReservation.product_id == product_id) &
+        (StockReservation.warehouse_id == warehouse_id) &
+        (StockReservation.expires_at > datetime.utcnow())
+    ).scalar_subquery()
+    query = update(ProductLocation).where(
+        (ProductLocation.product_id == product_id) &
+        (ProductLocation.warehouse_id == warehouse_id) &
+        (ProductLocation.product_amount - reserved >= amount)
+    ).values(product_amount=ProductLocation.product_amount - amount).returning(ProductLocation.product_amount)
+    result = await session.execute(query, execution_options={'synchronize_session': False})
+    return result.scalar_one_or_none()
+
+
+async def transfer_stock(session, product_id: int, warehouse_old_id: int, warehouse_new_id: int, amount: int):
+    """Move ``amount`` units between warehouses inside the caller's transaction; the caller commits."""
+    if warehouse_old_id == warehouse_new_id:
+        raise HTTPException(status_code=400, detail='Source and destination warehouses are the same')
+    exists = select(
+        select(Product.id).where(Product.id == product_id).exists(),
+        select(Warehouse.id).where(Warehouse.id == warehouse_new_id).exists()
+    )
+    if not all((await session.execute(exists)).one()):
+        raise HTTPException(status_code=400, detail='Product or warehouse does not exist')
+    await lock_product_locations(session, [(product_id, warehouse_old_id), (product_id, warehouse_new_id)])
+    if await take_stock(session, product_id, warehouse_old_id, amount) is None:
+        raise HTTPException(status_code=400, detail='Product is not enough')
+    await add_stock(session, [(product_id, warehouse_new_id, amount)])
+    await session.execute(insert(ProductHistory).values(
+        product_id=product_id,
+        warehouse_old_id=warehouse_old_id,
+        warehouse_new_id=warehouse_new_id,
+        amount=amount,
+        last_update=datetime.utcnow()
+    ))
+
+
+async def bulk_transfer_stock(session, moves, atomic: bool = True):
+    """Validate and apply many transfers with set-based statements inside the caller's transaction.
+
+    Moves are checked in order against the locked stock less its active reservations, so a later move may ship
+    units an earlier one brought in but never units held for an order.
+    Returns one result per move; with ``atomic`` nothing is applied unless every move is valid.
+    """
+    keys = {(move.product_id, move.warehouse_old_id) for move in moves}
+    keys |= {(move.product_id, move.warehouse_new_id) for move in moves}
+    stock = await lock_product_locations(session, keys) if keys else {}
+    reserved = await reserved_amounts(session, keys)
+    # Reserved units belong to pending orders, so only the rest can be moved.
+    free = {key: amount - reserved.get(key, 0) for key, amount in stock.items()}
+    products = set((await session.execute(
+        select(Product.id).where(Product.id.in_({move.product_id for move in moves})))).scalars().all())
+    warehouses = set((await session.execute(
+        select(Warehouse.id).where(Warehouse.id.in_({move.warehouse_new_id for move in moves})))).scalars().all())
+
+    available = defaultdict(int, free)
+    results = []
+    for index, move in enumerate(moves):
+        source = (move.product_id, move.warehouse_old_id)
+        if move.warehouse_old_id == move.warehouse_new_id:
+            detail = 'Source and destination warehouses are the same'
+        elif move.product_id not in products or move.warehouse_new_id not in warehouses:
+            detail = 'Product or warehouse does not exist'
+        elif available[source] < move.amount:
+            detail = 'Product is not enough'
+        else:
+            available[source] -= move.amount
+            available[(move.product_id, move.warehouse_new_id)] += move.amount
+            detail = None
+        results.append({'index': index, 'success': detail is None, 'detail': detail})
+
+    applied = [move for move, result in zip(moves, results) if result['success']]
+    if not applied or (atomic and len(applied) < len(moves)):
+        return results, False
+
+    deltas = [
+        (product_id, warehouse_id, amount - free.get((product_id, warehouse_id), 0))
+        for (product_id, warehouse_id), amount in available.items()
+        if amount != free.get((product_id, warehouse_id), 0)
+    ]
+    if deltas:
+        await add_stock(session, deltas)
+    now = datetime.utcnow()
+    await session.execute(insert(ProductHistory).values([
+        {
+            'product_id': move.product_id,
+            'warehouse_old_id': move.warehouse_old_id,
+            'warehouse_new_id': move.warehouse_new_id,
+            'amount': move.amount,
+            'last_update': now
+        }
+        for move in applied
+    ]))
+    return results, True
+
+
+async def iter_line_batches(chunks):
+    """Split an async stream of byte chunks into lists of complete lines without buffering the whole body."""
+    buffer = b''
+    async for chunk in chunks:
+        *lines, buffer = (buffer + chunk).split(b'\n')
+        if lines:
+            yield lines
+    if buffer:
+        yield [buffer]
+
+
+async def iter_import_batches(chunks, file_format: str):
+    """Yield lists of ``(line_number, product_id, warehouse_id, product_amount)`` parsed from CSV or NDJSON."""
+    columns = None if file_format == 'csv' else IMPORT_COLUMNS
+    line_number = 0
+    async for lines in iter_line_batches(chunks):
+        records = []
+        for line in lines:
+            line_number += 1
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                if file_format == 'csv':
+                    values = line.decode().split(',') if b'"' not in line else next(csv.reader([line.decode()]))
+                    if columns is None:
+                        columns = [value.strip() for value in values]
+                        if not set(IMPORT_COLUMNS) <= set(columns):
+                            raise ValueError(f'header must contain {", ".join(IMPORT_COLUMNS)}')
+                        positions = [columns.index(column) for column in IMPORT_COLUMNS]
+                        continue
+                    record = (line_number, *(int(values[position]) for position in positions))
+                else:
+                    row = json.loads(line)
+                    record = (line_number, *(int(row[column]) for column in IMPORT_COLUMNS))
+                if record[3] < 0:
+                    raise ValueError('product_amount must not be negative')
+                records.append(record)
+            except (ValueError, KeyError, TypeError, IndexError) as e:
+                raise HTTPException(status_code=400, detail=f'Invalid row on line {line_number}: {e}')
+        if records:
+            yield records
+
+
+async def import_product_locations(session, chunks, file_format: str = 'csv', mode: str = 'replace'):
+    """COPY a streamed CSV/NDJSON file into a staging table and merge it into product_location with one upsert.
+
+    ``replace`` sets the amount (the last row wins for repeated keys), ``add`` adds the summed amounts to stock.
+    Rows whose amount would not change are left untouched, and rows pointing at unknown products or warehouses
+    are skipped and counted. A negative amount is a 400 naming its line, and the staging table refuses one too, so
+    ``add`` can only raise stock and never takes it below zero or below what is reserved. ``replace`` locks the
+    rows it overwrites and refuses the whole file with a 400 listing the rows that would drop below their active
+    reservations.
+    """
+    await session.execute(text(
+        'CREATE TEMP TABLE product_location_import '
+        '(seq bigint, product_id integer, warehouse_id integer, product_amount integer CHECK (product_amount >= 0)) '
+        'ON COMMIT DROP'
+    ))
+    connection = await session.connection()
+    raw_connection = await connection.get_raw_connection()
+    driver = raw_connection.driver_connection
+
+    rows = 0
+    batch = []
+    async for records in iter_import_batches(chunks, file_format):
+        batch.extend(records)
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            await driver.copy_records_to_table('product_location_import', records=batch)
+            rows += len(batch)
+            batch = []
+    if batch:
+        await driver.copy_records_to_table('product_location_import', records=batch)
+        rows += len(batch)
+
+    known = (
+        'EXISTS (SELECT 1 FROM product WHERE product.id = s.product_id) '
+        'AND EXISTS (SELECT 1 FROM warehouse WHERE warehouse.id = s.warehouse_id)'
+    )
+    if mode == 'add':
+        source = (
+            f'SELECT product_id, warehouse_id, sum(product_amount) FROM product_location_import s WHERE {known} '
+            'GROUP BY product_id, warehouse_id ORDER BY product_id, warehouse_id'
+        )
+        new_amount = 'product_location.product_amount + EXCLUDED.product_amount'
+    else:
+        source = (
+            'SELECT DISTINCT ON (product_id, warehouse_id) product_id, warehouse_id, product_amount '
+            f'FROM product_location_import s WHERE {known} ORDER BY product_id, warehouse_id, seq DESC'
+        )
+        new_amount = 'EXCLUDED.product_amount'
+        # Locked in the usual key order, so no reservation can land on these rows between the check and the merge.
+        await session.execute(text(
+            'SELECT 1 FROM product_location pl JOIN product_location_import s USING (product_id, warehouse_id) '
+            'ORDER BY pl.product_id, pl.warehouse_id FOR UPDATE OF pl'
+        ))
+        below = (await session.execute(text(
+            f'SELECT s.product_id, s.warehouse_id, s.product_amount, r.reserved FROM ({source}) s '
+            'JOIN (SELECT product_id, warehouse_id, sum(amount) AS reserved FROM stock_reservation '
+            'WHERE expires_at > :now GROUP BY product_id, warehouse_id) r USING (product_id, warehouse_id) '
+            'WHERE s.product_amount < r.reserved ORDER BY s.product_id, s.warehouse_id LIMIT 20'
+        ), {'now': datetime.utcnow()})).all()
+        if below:
+            raise HTTPException(status_code=400, detail={'message': 'Amount is below reserved stock', 'rows': [
+                {'product_id': product_id, 'warehouse_id': warehouse_id, 'product_amount': amount, 'reserved': reserved}
+                for product_id, warehouse_id, amount, reserved in below
+            ]})
+    merged = await session.execute(text(
+        f'INSERT INTO product_location (product_id, warehouse_id, product_amount) {source} '
+        f'ON CONFLICT (product_id, warehouse_id) DO UPDATE SET product_amount = {new_amount} '
+        f'WHERE product_location.product_amount IS DISTINCT FROM {new_amount}'
+    ))
+    skipped = await session.execute(text(f'SELECT count(*) FROM product_location_import s WHERE NOT ({known})'))
+    return {'rows': rows, 'merged': merged.rowcount, 'skipped': skipped.scalar_one()}
+
+
+def naive_utc(value):
+    """History timestamps are stored as naive UTC; convert aware query parameters to match."""
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def history_export_query(since=None, until=None, warehouse_id=None):
+    query = select(
+        ProductHistory.id, ProductHistory.product_id, Product.name.label('product_name'),
+        ProductHistory.warehouse_old_id, ProductHistory.warehouse_new_id, ProductHistory.amount,
+        ProductHistory.last_update
+    ).outerjoin(Product, Product.id == ProductHistory.product_id).order_by(ProductHistory.id)
+    if since is not None:
+        query = query.where(ProductHistory.last_update >= since)
+    if until is not None:
+        query = query.where(ProductHistory.last_update < until)
+    if warehouse_id is not None:
+        query = query.where(
+            (ProductHistory.warehouse_old_id == warehouse_id) | (ProductHistory.warehouse_new_id == warehouse_id)
+        )
+    return query
+
+
+def format_history_rows(rows, file_format: str) -> str:
+    if file_format == 'csv':
+        buffer = io.StringIO()
+        csv.writer(buffer, lineterminator='\n').writerows(
+            [*row[:-1], row[-1].isoformat() if row[-1] else ''] for row in rows
+        )
+        return buffer.getvalue()
+    return ''.join(
+        json.dumps(dict(zip(HISTORY_EXPORT_COLUMNS, row)), default=datetime.isoformat) + '\n' for row in rows
+    )
+
+
+async def stream_history_export(query, file_format: str = 'ndjson'):
+    """Yield the rows of ``query`` as CSV/NDJSON, EXPORT_BATCH_SIZE rows at a time, from a server-side cursor.
+
+    The response body outlives the request's session dependency, so the export opens and closes its own session.
+    """
+    if file_format == 'csv':
+        yield ','.join(HISTORY_EXPORT_COLUMNS) + '\n'
+    async with await open_read_session() as session:
+        result = await session.stream(query.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        async for rows in result.partitions():
+            yield format_history_rows(rows, file_format)
@@ -1,20 +1,26 @@
-from typing import List
+from datetime import datetime
+from typing import List, Union, Literal
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy import select, insert, update
 from sqlalchemy.exc import NoResultFound
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import selectinload
 
-from database import get_async_session
+from database import get_async_session, get_async_read_session
+from idempotency import IdempotencyKey
 from market.scheme import ProductGetScheme
+from pagination import PageParams, paginate
 from models.models import Warehouse, WarehouseType, Product, ProductLocation, Category, Unit, ProductHistory, \
     ResourceLocation
 
 from .scheme import WarehouseGetScheme, WarehouseAddScheme, ProductLocationAddScheme, ProductLocationGetScheme, \
     UpdatePLScheme, WarehouseProductScheme, CategoriesScheme, HistoryGetScheme, WarehouseResource, ResourceGetScheme, \
-    WarehouseResourceScheme
+    WarehouseResourceScheme, BulkTransferScheme, NearestWarehouseScheme
+from .spatial import nearest_warehouses
+from .utils import transfer_stock, bulk_transfer_stock, import_product_locations, history_export_query, \
+    stream_history_export, naive_utc
 
 warehouse_router = APIRouter()
 
@@ -29,6 +35,18 @@ async def get_warehouses(
     return warehouses
 
 
+@warehouse_router.get("/nearest", response_model=List[NearestWarehouseScheme])
+async def get_nearest_warehouses(
+        product_id: int,
+        latitude: float = Query(ge=-90, le=90),
+        longitude: float = Query(ge=-180, le=180),
+        min_amount: int = Query(1, ge=1),
+        k: int = Query(5, gt=0, le=100),
+        session: AsyncSession = Depends(get_async_read_session)
+):
+    return await nearest_warehouses(session, product_id, latitude, longitude, min_amount, k)
+
+
 @warehouse_router.post("/create_warehouse")
 async def create_warehouse(
         warehouse: WarehouseAddScheme,
@@ -81,13 +99,26 @@ async def add_product_location(
     return {'success': True, 'message': 'Product location has been added'}
 
 
+@warehouse_router.post("/import-product_locations")
+async def import_product_location_file(
+    request: Request,
+    file_format: Literal['csv', 'ndjson'] = Query('csv', alias='format'),
+    mode: Literal['replace', 'add'] = 'replace',
+    session: AsyncSession = Depends(get_async_session)
+):
+    result = await import_product_locations(session, request.stream(), file_format, mode)
+    await session.commit()
+    return {'success': True, **result}
+
+
 @warehouse_router.get('/product_locations', response_model=List[ProductLocationGetScheme])
 async def get_product_locations(
+    response: Response,
+    page: PageParams = Depends(),
     session: AsyncSession = Depends(get_async_session)
 ):
-    query = select(ProductLocation).order_by(ProductLocation.warehouse_id)
-    data = await session.execute(query)
-    return data.scalars().all()
+    query = select(ProductLocation)
+    return await paginate(session, query, [ProductLocation.warehouse_id, ProductLocation.id], page, response)
 
 
 @warehouse_router.get('/product_locations/{id}', response_model=List[ProductLocationGetScheme])
@@ -103,81 +134,92 @@ async def get_product_location(
 @warehouse_router.patch("/update-product_location")
 async def update_product_location(
         data: UpdatePLScheme,
+        idempotency: IdempotencyKey = Depends(),
         session: AsyncSession = Depends(get_async_session)
 ):
-    query_new = select(ProductLocation).where(
-        (ProductLocation.product_id == data.product_id) and
-        (ProductLocation.warehouse_id == data.warehouse_new_id)
-    )
-    new_loc = await session.execute(query_new)
-    new_loc_data = new_loc.scalars().first()
-    try:
-        query_old = select(ProductLocation).where(
-            (ProductLocation.warehouse_id == data.warehouse_old_id) and (ProductLocation.product_id == data.product_id)
-        )
-        old_loc = await session.execute(query_old)
-        old_loc_data = old_loc.scalars().first()
-    except IntegrityError as e:
-        raise HTTPException(status_code=401, detail=str(e))
-    is_changed = False
-    print(new_loc_data)
-    print(old_loc_data.product_amount)
-    if not new_loc_data and old_loc_data and old_loc_data.product_amount >= data.amount:
-        await session.execute(insert(ProductLocation).values(
-            warehouse_id=data.warehouse_new_id,
-            product_id=data.product_id,
-            product_amount=data.amount
-        ))
-        query1 = update(ProductLocation).where(
-            ProductLocation.id == old_loc_data.id and ProductLocation.product_id == data.product_id).values(
-            product_amount=int(old_loc_data.product_amount - data.amount))
-        await session.execute(query1)
-        await session.commit()
-        is_changed = True
-    elif new_loc_data and old_loc_data.product_amount >= data.amount:
-        query1 = update(ProductLocation).where(ProductLocation.id == old_loc_data.id and ProductLocation.product_id==data.product_id).values(product_amount=int(old_loc_data.product_amount - data.amount))
-        await session.execute(query1)
-        query2 = update(ProductLocation).where(ProductLocation.id == new_loc_data.id and ProductLocation.product_id==data.product_id).values(product_amount=int(data.amount + new_loc_data.product_amount))
-        await session.execute(query2)
-        await session.commit()
-        is_changed = True
+    replay = await idempotency.begin(session, 'update-product_location')
+    if replay:
+        return replay
+    await transfer_stock(session, data.product_id, data.warehouse_old_id, data.warehouse_new_id, data.amount)
+    result = await idempotency.finish(session, {'success': True, 'message': 'Product location has been updated'})
+    await session.commit()
+    return result
 
-    else:
-        raise HTTPException(status_code=400, detail='Bad Request')
 
-    if is_changed:
-        query3 = insert(ProductHistory).values(**data.dict())
-        await session.execute(query3)
-        await session.commit()
-        return {'success': True, 'message': 'Product location has been updated'}
+@warehouse_router.post("/bulk-transfer")
+async def bulk_transfer(
+        data: BulkTransferScheme,
+        atomic: bool = True,
+        session: AsyncSession = Depends(get_async_session)
+):
+    results, applied = await bulk_transfer_stock(session, data.moves, atomic)
+    if not applied:
+        raise HTTPException(status_code=400, detail=results)
+    await session.commit()
+    return {'success': True, 'results': results}
 
 
 @warehouse_router.get('/warehouse_products', response_model=List[WarehouseProductScheme])
 async def get_warehouse_products(
         warehouse_id: int,
+        after_id: int = 0,
+        limit: int = Query(100, gt=0, le=1000),
+        category_id: Union[int, None] = None,
+        min_amount: Union[int, None] = None,
         session: AsyncSession = Depends(get_async_session)
 ):
-    query = select(ProductLocation).where(ProductLocation.warehouse_id == warehouse_id)
+    query = select(
+        Product.id, Product.name, Product.description, Product.category_id, Product.unit_id, Product.price,
+        ProductLocation.product_amount.label('amount'),
+        Category.name.label('category_name'),
+        Unit.name.label('unit_name')
+    ).join(ProductLocation, ProductLocation.product_id == Product.id).outerjoin(
+        Category, Category.id == Product.category_id).outerjoin(
+        Unit, Unit.id == Product.unit_id).where(
+        (ProductLocation.warehouse_id == warehouse_id) & (Product.id > after_id)
+    ).order_by(Product.id).limit(limit)
+    if category_id is not None:
+        query = query.where(Product.category_id == category_id)
+    if min_amount is not None:
+        query = query.where(ProductLocation.product_amount >= min_amount)
     data = await session.execute(query)
-    loc_data = data.scalars().all()
-    product_list = []
-    for loc in loc_data:
-        query = select(Product).where(Product.id == loc.product_id)
-        product = await session.execute(query)
-        data = product.scalars().first()
-        data.amount = loc.product_amount
-        product_list.append(data)
-    return product_list
+    return data.mappings().all()
 
 
 @warehouse_router.get('/history', response_model=List[HistoryGetScheme])
 async def get_history(
-        session: AsyncSession = Depends(get_async_session)
+        response: Response,
+        since: Union[datetime, None] = None,
+        until: Union[datetime, None] = None,
+        page: PageParams = Depends(),
+        session: AsyncSession = Depends(get_async_read_session)
 ):
-    query = select(ProductHistory).options(selectinload(ProductHistory.product)).order_by(ProductHistory.product_id)
-    data = await session.execute(query)
-    lis = data.scalars().all()
-    return lis
+    since, until = naive_utc(since), naive_utc(until)
+    query = select(ProductHistory).options(selectinload(ProductHistory.product))
+    if since is not None:
+        query = query.where(ProductHistory.last_update >= since)
+    if until is not None:
+        query = query.where(ProductHistory.last_update < until)
+    return await paginate(session, query, [ProductHistory.last_update, ProductHistory.id], page, response)
+
+
+@warehouse_router.get('/history/export')
+async def export_history(
+        file_format: Literal['ndjson', 'csv'] = Query('ndjson', alias='format'),
+        since: Union[datetime, None] = None,
+        until: Union[datetime, None] = None,
+        warehouse_id: Union[int, None] = None
+):
+    since, until = naive_utc(since), naive_utc(until)
+    if since is not None and until is not None and since >= until:
+        raise HTTPException(status_code=400, detail='since must be earlier than until')
+    query = history_export_query(since, until, warehouse_id)
+    media_type = 'text/csv' if file_format == 'csv' else 'application/x-ndjson'
+    return StreamingResponse(
+        stream_history_export(query, file_format),
+        media_type=media_type,
+        headers={'Content-Disposition': f'attachment; filename="product_history.{file_format}"'}
+    )
 
 
 @warehouse_router.get('/warehouse-resource', response_model=List[WarehouseResource])
@@ -196,12 +238,12 @@ async def get_warehouse_resource(
 
 @warehouse_router.get('/all-resources-location', response_model=List[WarehouseResourceScheme])
 async def get_all_resources_location(
-        session: AsyncSession = Depends(get_async_session)
+        response: Response,
+        page: PageParams = Depends(),
+        session: AsyncSession = Depends(get_async_read_session)
 ):
     query = select(ResourceLocation).options(selectinload(ResourceLocation.resource), selectinload(ResourceLocation.warehouse))
-    resource_data = await session.execute(query)
-    data = resource_data.scalars().all()
-    return data
+    return await paginate(session, query, [ResourceLocation.id], page, response)
 
 
 